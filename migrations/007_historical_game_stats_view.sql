@@ -0,0 +1,26 @@
+-- Migration 007: Precomputed per-game payment stats for forecasting
+-- Run after 006_add_player_photos.sql
+-- Refreshed by the budget_analytics job (REFRESH MATERIALIZED VIEW CONCURRENTLY)
+
+BEGIN;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_historical_game_stats AS
+SELECT
+  gs.id AS game_id,
+  gs.game_date,
+  EXTRACT(dow FROM gs.game_date)::int AS weekday,  -- 0 = Sunday
+  gs.location,
+  COUNT(ep.id) AS payment_count,
+  COALESCE(SUM(ep.amount), 0) AS total_revenue
+FROM game_schedule gs
+LEFT JOIN event_payments ep ON (ep.game_id = gs.id AND ep.status = 'confirmed')
+WHERE gs.game_date < NOW()
+GROUP BY gs.id, gs.game_date, gs.location;
+
+-- Unique index is required for REFRESH ... CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_historical_game_stats_game_id
+  ON mv_historical_game_stats(game_id);
+CREATE INDEX IF NOT EXISTS idx_mv_historical_game_stats_lookup
+  ON mv_historical_game_stats(location, weekday, game_date);
+
+COMMIT;
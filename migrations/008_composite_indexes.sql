@@ -0,0 +1,18 @@
+-- Migration 008: Composite indexes for payment and poll vote lookups
+-- Run after 007_historical_game_stats_view.sql
+-- event_payments (game_id, player_id) is already covered by unique_game_player_payment
+-- and game_schedule(game_date) by idx_game_schedule_game_date.
+
+BEGIN;
+
+-- Budget endpoint: votes for a given option of a poll
+CREATE INDEX IF NOT EXISTS idx_poll_votes_poll_option ON poll_votes(poll_id, option_id);
+
+-- Next game players: votes of a poll ordered by response time
+CREATE INDEX IF NOT EXISTS idx_poll_votes_poll_voted_at ON poll_votes(poll_id, voted_at);
+
+-- Redundant: leading columns of the unique (game_id, player_id) / (poll_id, user_id) indexes
+DROP INDEX IF EXISTS idx_event_payments_game_id;
+DROP INDEX IF EXISTS idx_poll_votes_poll_id;
+
+COMMIT;
@@ -0,0 +1,14 @@
+-- Migration 009: Stored weekday column for same-weekday game lookups
+-- Run after 008_composite_indexes.sql
+
+BEGIN;
+
+-- 0 = Sunday, matching EXTRACT(dow)
+ALTER TABLE game_schedule
+  ADD COLUMN IF NOT EXISTS game_weekday SMALLINT
+  GENERATED ALWAYS AS (EXTRACT(dow FROM game_date)::smallint) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_game_schedule_location_weekday_date
+  ON game_schedule(location, game_weekday, game_date);
+
+COMMIT;
@@ -0,0 +1,11 @@
+-- Migration 010: Index for confirmed payments of a game in payment order
+-- Run after 009_game_schedule_weekday.sql
+-- players(username) is already covered by idx_players_username.
+
+BEGIN;
+
+-- /who_paid and budget: confirmed payments of a game ordered by paid_at
+CREATE INDEX IF NOT EXISTS idx_event_payments_game_status_paid_at
+  ON event_payments(game_id, status, paid_at);
+
+COMMIT;
@@ -0,0 +1,10 @@
+-- Migration 011: Input digest for skipping unchanged budget cache rows
+-- Run after 010_event_payments_game_status_index.sql
+
+BEGIN;
+
+-- Hash of the payments, votes and game settings a budget_cache row was computed from
+ALTER TABLE budget_cache
+  ADD COLUMN IF NOT EXISTS input_digest VARCHAR(64);
+
+COMMIT;
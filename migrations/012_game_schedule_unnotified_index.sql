@@ -0,0 +1,15 @@
+-- Migration 012: Partial index for games still awaiting their reminder
+-- Run after 011_budget_cache_input_digest.sql
+-- The forecast lookup (location, weekday, game_date) is already covered by
+-- idx_game_schedule_location_weekday_date from migration 009.
+
+BEGIN;
+
+-- Notification job: upcoming games with notified = false
+CREATE INDEX IF NOT EXISTS idx_game_schedule_unnotified_game_date
+  ON game_schedule(game_date) WHERE notified = false;
+
+-- Superseded: a boolean index the planner skips in favour of the partial index
+DROP INDEX IF EXISTS idx_game_schedule_notified;
+
+COMMIT;
@@ -0,0 +1,19 @@
+-- Migration 013: Pool of pre-generated trivia questions
+-- Run after 012_game_schedule_unnotified_index.sql
+-- The trivia job generates a batch per Gemini call and posts one per run.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS trivia_questions (
+  id SERIAL PRIMARY KEY,
+  topic VARCHAR(100) NOT NULL,
+  question JSONB NOT NULL,                  -- {question, options, correct_answer}
+  created_at TIMESTAMP DEFAULT NOW(),
+  used_at TIMESTAMP                         -- NULL until posted as a poll
+);
+
+-- Next unused question, oldest first
+CREATE INDEX IF NOT EXISTS idx_trivia_questions_unused
+  ON trivia_questions(id) WHERE used_at IS NULL;
+
+COMMIT;
@@ -1,31 +1,48 @@
 """Payment and budget tracking endpoints"""
+import time
 from datetime import datetime, timedelta
 from decimal import Decimal
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional, Tuple
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import select, func, and_
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import select, func, and_, true, lambda_stmt
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
-from db import get_db, GameSchedule, EventPayment, Player, Poll, PollVote, BudgetCache, ForecastCache
+from config import settings
+from db import (
+    get_db, GameSchedule, EventPayment, Player, Poll, PollVote, BudgetCache, ForecastCache,
+    historical_game_stats
+)
 
 payment_router = APIRouter(prefix="/api")
 
+PaymentStatus = Literal["pending", "confirmed", "refunded"]
+
+# Postgres foreign_key_violation, mapped to 404 by the referenced row
+FOREIGN_KEY_VIOLATION = "23503"
+PAYMENT_FK_NOT_FOUND = {
+    "event_payments_game_id_fkey": "Game not found",
+    "event_payments_player_id_fkey": "Player not found",
+}
+
 
 # Pydantic models
 class PaymentCreate(BaseModel):
     player_id: int
-    amount: float
+    amount: Decimal = Field(ge=0)
     currency: str = "ILS"
     method: str = "paybox"
-    status: str = "confirmed"
+    status: PaymentStatus = "confirmed"
     external_payment_id: Optional[str] = None
     notes: Optional[str] = None
 
 
 class PaymentUpdate(BaseModel):
-    amount: Optional[float] = None
-    status: Optional[str] = None
+    amount: Optional[Decimal] = Field(default=None, ge=0)
+    status: Optional[PaymentStatus] = None
     notes: Optional[str] = None
 
 
@@ -70,6 +87,16 @@ class BudgetResponse(BaseModel):
     unpaid_players: List[PlayerSummary]
 
 
+class BudgetSummary(BaseModel):
+    game_id: int
+    price_per_player: float
+    expected_income: float
+    actual_income: float
+    number_of_payers: int
+    registered_players: int
+    unpaid_players: int
+
+
 class ForecastResponse(BaseModel):
     game_id: int
     game_date: datetime
@@ -80,6 +107,18 @@ class ForecastResponse(BaseModel):
     historical_data: dict
 
 
+# In-process budget cache: game_id -> (monotonic timestamp, response).
+# invalidate_budget_cache only reaches the worker that handled the write, so the
+# cache is disabled when uvicorn runs several workers (WEB_CONCURRENCY > 1)
+BUDGET_CACHE_TTL_SECONDS = 30 if settings.api_workers == 1 else 0
+_budget_cache: Dict[int, Tuple[float, BudgetResponse]] = {}
+
+
+def invalidate_budget_cache(game_id: int):
+    """Drop the cached budget of a game after its payments change"""
+    _budget_cache.pop(game_id, None)
+
+
 # Payment CRUD endpoints
 @payment_router.post("/games/{game_id}/payments", response_model=PaymentResponse)
 async def create_payment(
@@ -91,53 +130,61 @@ async def create_payment(
     Create a new payment record for a game.
     Admin endpoint - should be protected with authentication.
     """
-    # Verify game exists
-    game_result = await db.execute(select(GameSchedule).where(GameSchedule.id == game_id))
-    game = game_result.scalar_one_or_none()
-    if not game:
-        raise HTTPException(status_code=404, detail="Game not found")
-
-    # Verify player exists
-    player_result = await db.execute(select(Player).where(Player.id == payment.player_id))
-    player = player_result.scalar_one_or_none()
-    if not player:
-        raise HTTPException(status_code=404, detail="Player not found")
-
-    # Check if payment already exists
-    existing = await db.execute(
-        select(EventPayment).where(
-            and_(
-                EventPayment.game_id == game_id,
-                EventPayment.player_id == payment.player_id
-            )
+    # Insert and read back the player in one round-trip. Duplicates are skipped by
+    # ON CONFLICT, missing game/player rows surface as foreign key violations.
+    inserted = (
+        pg_insert(EventPayment)
+        .values(
+            game_id=game_id,
+            player_id=payment.player_id,
+            amount=payment.amount,
+            currency=payment.currency,
+            method=payment.method,
+            status=payment.status,
+            external_payment_id=payment.external_payment_id,
+            notes=payment.notes,
+            paid_at=datetime.utcnow()
         )
+        .on_conflict_do_nothing(index_elements=["game_id", "player_id"])
+        .returning(
+            EventPayment.id,
+            EventPayment.game_id,
+            EventPayment.player_id,
+            EventPayment.amount,
+            EventPayment.currency,
+            EventPayment.paid_at,
+            EventPayment.method,
+            EventPayment.status,
+            EventPayment.external_payment_id
+        )
+        .cte("inserted")
     )
-    if existing.scalar_one_or_none():
-        raise HTTPException(status_code=400, detail="Payment already exists for this player and game")
 
-    # Create payment
-    new_payment = EventPayment(
-        game_id=game_id,
-        player_id=payment.player_id,
-        amount=Decimal(str(payment.amount)),
-        currency=payment.currency,
-        method=payment.method,
-        status=payment.status,
-        external_payment_id=payment.external_payment_id,
-        notes=payment.notes,
-        paid_at=datetime.utcnow()
-    )
+    try:
+        result = await db.execute(
+            select(inserted, Player.username, Player.display_name)
+            .join(Player, Player.id == inserted.c.player_id)
+        )
+    except IntegrityError as e:
+        await db.rollback()
+        constraint = getattr(e.orig.__cause__, "constraint_name", None)
+        if getattr(e.orig, "sqlstate", None) == FOREIGN_KEY_VIOLATION and constraint in PAYMENT_FK_NOT_FOUND:
+            raise HTTPException(status_code=404, detail=PAYMENT_FK_NOT_FOUND[constraint])
+        raise HTTPException(status_code=400, detail="Invalid payment")
+
+    new_payment = result.one_or_none()
+    if not new_payment:
+        raise HTTPException(status_code=400, detail="Payment already exists for this player and game")
 
-    db.add(new_payment)
     await db.commit()
-    await db.refresh(new_payment)
+    invalidate_budget_cache(game_id)
 
-    return PaymentResponse(
+    return PaymentResponse.model_construct(
         id=new_payment.id,
         game_id=new_payment.game_id,
         player_id=new_payment.player_id,
-        player_username=player.username,
-        player_display_name=player.display_name,
+        player_username=new_payment.username,
+        player_display_name=new_payment.display_name,
         amount=float(new_payment.amount),
         currency=new_payment.currency,
         paid_at=new_payment.paid_at,
@@ -172,6 +219,7 @@ async def delete_payment(
 
     await db.delete(payment)
     await db.commit()
+    invalidate_budget_cache(game_id)
 
     return {"message": "Payment deleted successfully"}
 
@@ -199,7 +247,7 @@ async def update_payment(
 
     # Update fields
     if payment_update.amount is not None:
-        payment.amount = Decimal(str(payment_update.amount))
+        payment.amount = payment_update.amount
     if payment_update.status is not None:
         payment.status = payment_update.status
     if payment_update.notes is not None:
@@ -207,12 +255,13 @@ async def update_payment(
 
     await db.commit()
     await db.refresh(payment)
+    invalidate_budget_cache(game_id)
 
     # Get player info
     player_result = await db.execute(select(Player).where(Player.id == player_id))
     player = player_result.scalar_one()
 
-    return PaymentResponse(
+    return PaymentResponse.model_construct(
         id=payment.id,
         game_id=payment.game_id,
         player_id=payment.player_id,
@@ -227,19 +276,54 @@ async def update_payment(
     )
 
 
+def latest_game_poll_id(game_id: int):
+    """Scalar subquery for the poll_id of the latest game poll of a game"""
+    return (
+        select(Poll.poll_id)
+        .where(
+            and_(
+                Poll.game_id == game_id,
+                Poll.poll_type == "game"
+            )
+        )
+        .order_by(Poll.created_at.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+def confirmed_payers_cte(game_id: int):
+    """CTE of (player_id, payment_id) for the confirmed payments of a game"""
+    return (
+        select(EventPayment.player_id, EventPayment.id.label("payment_id"))
+        .where(
+            and_(
+                EventPayment.game_id == game_id,
+                EventPayment.status == "confirmed"
+            )
+        )
+        .cte("paid")
+    )
+
+
 # Budget endpoint
-@payment_router.get("/games/{game_id}/budget", response_model=BudgetResponse)
 async def get_game_budget(
     game_id: int,
-    db: AsyncSession = Depends(get_db)
-):
+    db: AsyncSession
+) -> BudgetResponse:
     """
     Get budget information for a game including:
     - Expected income
     - Actual income (from confirmed payments)
     - List of paid players
     - List of unpaid players (who registered but haven't paid)
+
+    Responses are cached per game for BUDGET_CACHE_TTL_SECONDS.
     """
+    cached = _budget_cache.get(game_id)
+    if cached and time.monotonic() - cached[0] < BUDGET_CACHE_TTL_SECONDS:
+        return cached[1]
+
     # Get game details
     game_result = await db.execute(select(GameSchedule).where(GameSchedule.id == game_id))
     game = game_result.scalar_one_or_none()
@@ -247,9 +331,16 @@ async def get_game_budget(
     if not game:
         raise HTTPException(status_code=404, detail="Game not found")
 
-    # Get all confirmed payments
+    # Get all confirmed payments (only the columns the summaries need)
     payments_result = await db.execute(
-        select(EventPayment, Player)
+        select(
+            EventPayment.id.label("payment_id"),
+            EventPayment.amount,
+            Player.id,
+            Player.telegram_user_id,
+            Player.username,
+            Player.display_name
+        )
         .join(Player, EventPayment.player_id == Player.id)
         .where(
             and_(
@@ -261,61 +352,59 @@ async def get_game_budget(
     payments_with_players = payments_result.all()
 
     # Calculate actual income
-    actual_income = sum(float(payment.amount) for payment, _ in payments_with_players)
+    actual_income = sum(float(row.amount) for row in payments_with_players)
     number_of_payers = len(payments_with_players)
 
-    # Get registered players from game poll
-    poll_result = await db.execute(
-        select(Poll).where(
+    # Confirmed payers, joined against voters so the paid/unpaid split happens in SQL
+    latest_poll_id = latest_game_poll_id(game_id)
+    paid_cte = confirmed_payers_cte(game_id)
+
+    # Registered players: votes for "I'm in!" option (assuming option_id 0)
+    votes_result = await db.execute(
+        select(
+            Player.id,
+            Player.telegram_user_id,
+            Player.username,
+            Player.display_name,
+            paid_cte.c.payment_id
+        )
+        .select_from(PollVote)
+        .outerjoin(Player, PollVote.user_id == Player.telegram_user_id)
+        .outerjoin(paid_cte, paid_cte.c.player_id == Player.id)
+        .where(
             and_(
-                Poll.game_id == game_id,
-                Poll.poll_type == "game"
-            )
-        ).order_by(Poll.created_at.desc())
-    )
-    poll = poll_result.scalar_one_or_none()
-
-    registered_players = []
-    if poll:
-        # Get all votes for "I'm in!" option (assuming option_id 0)
-        votes_result = await db.execute(
-            select(PollVote, Player)
-            .outerjoin(Player, PollVote.user_id == Player.telegram_user_id)
-            .where(
-                and_(
-                    PollVote.poll_id == poll.poll_id,
-                    PollVote.option_id == 0  # "I'm in!" option
-                )
+                PollVote.poll_id == latest_poll_id,
+                PollVote.option_id == 0  # "I'm in!" option
             )
         )
-        registered_players = votes_result.all()
+    )
+    registered_players = votes_result.all()
 
     # Build paid and unpaid player lists
-    paid_player_ids = {payment.player_id for payment, _ in payments_with_players}
-
     paid_players = []
-    for payment, player in payments_with_players:
-        paid_players.append(PlayerSummary(
-            player_id=player.id,
-            telegram_user_id=player.telegram_user_id,
-            username=player.username,
-            display_name=player.display_name,
+    for row in payments_with_players:
+        paid_players.append(PlayerSummary.model_construct(
+            player_id=row.id,
+            telegram_user_id=row.telegram_user_id,
+            username=row.username,
+            display_name=row.display_name,
             amount_due=float(game.price_per_player) if game.price_per_player else 0,
             paid=True,
-            payment_id=payment.id
+            payment_id=row.payment_id
         ))
 
-    unpaid_players = []
-    for vote, player in registered_players:
-        if player and player.id not in paid_player_ids:
-            unpaid_players.append(PlayerSummary(
-                player_id=player.id,
-                telegram_user_id=player.telegram_user_id,
-                username=player.username,
-                display_name=player.display_name,
-                amount_due=float(game.price_per_player) if game.price_per_player else 0,
-                paid=False
-            ))
+    unpaid_players = [
+        PlayerSummary.model_construct(
+            player_id=row.id,
+            telegram_user_id=row.telegram_user_id,
+            username=row.username,
+            display_name=row.display_name,
+            amount_due=float(game.price_per_player) if game.price_per_player else 0,
+            paid=False
+        )
+        for row in registered_players
+        if row.id is not None and row.payment_id is None
+    ]
 
     # Calculate expected income
     price = float(game.price_per_player) if game.price_per_player else 0
@@ -324,7 +413,7 @@ async def get_game_budget(
     else:
         expected_income = price * len(registered_players) if registered_players else 0
 
-    return BudgetResponse(
+    budget = BudgetResponse.model_construct(
         game_id=game.id,
         game_date=game.game_date,
         location=game.location,
@@ -337,6 +426,103 @@ async def get_game_budget(
         paid_players=paid_players,
         unpaid_players=unpaid_players
     )
+    _budget_cache[game_id] = (time.monotonic(), budget)
+
+    return budget
+
+
+@payment_router.get("/games/{game_id}/budget", response_class=ORJSONResponse)
+async def game_budget(
+    game_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Get budget information for a game (see get_game_budget).
+    The response is built without validation, so it is dumped straight to JSON.
+    """
+    budget = await get_game_budget(game_id, db)
+    return ORJSONResponse(budget.model_dump())
+
+
+async def get_game_budget_summary(
+    game_id: int,
+    db: AsyncSession
+) -> BudgetSummary:
+    """
+    Get the budget totals of a game without the player lists.
+    Counts and sums are computed by Postgres in a single query.
+    """
+    # Confirmed payments: count and sum
+    payment_totals = (
+        select(
+            func.count().label("number_of_payers"),
+            func.coalesce(func.sum(EventPayment.amount), 0).label("actual_income")
+        )
+        .where(
+            and_(
+                EventPayment.game_id == game_id,
+                EventPayment.status == "confirmed"
+            )
+        )
+        .subquery()
+    )
+
+    # Registered players: votes for "I'm in!" option (assuming option_id 0)
+    paid_cte = confirmed_payers_cte(game_id)
+    vote_totals = (
+        select(
+            func.count().label("registered_players"),
+            func.count().filter(
+                and_(Player.id.isnot(None), paid_cte.c.payment_id.is_(None))
+            ).label("unpaid_players")
+        )
+        .select_from(PollVote)
+        .outerjoin(Player, PollVote.user_id == Player.telegram_user_id)
+        .outerjoin(paid_cte, paid_cte.c.player_id == Player.id)
+        .where(
+            and_(
+                PollVote.poll_id == latest_game_poll_id(game_id),
+                PollVote.option_id == 0
+            )
+        )
+        .subquery()
+    )
+
+    result = await db.execute(
+        select(
+            GameSchedule.price_per_player,
+            GameSchedule.max_players,
+            payment_totals.c.number_of_payers,
+            payment_totals.c.actual_income,
+            vote_totals.c.registered_players,
+            vote_totals.c.unpaid_players
+        )
+        .select_from(GameSchedule)
+        .join(payment_totals, true())
+        .join(vote_totals, true())
+        .where(GameSchedule.id == game_id)
+    )
+    row = result.one_or_none()
+
+    if not row:
+        raise HTTPException(status_code=404, detail="Game not found")
+
+    # Calculate expected income
+    price = float(row.price_per_player) if row.price_per_player else 0
+    if row.max_players:
+        expected_income = price * row.max_players
+    else:
+        expected_income = price * row.registered_players
+
+    return BudgetSummary.model_construct(
+        game_id=game_id,
+        price_per_player=price,
+        expected_income=expected_income,
+        actual_income=float(row.actual_income),
+        number_of_payers=row.number_of_payers,
+        registered_players=row.registered_players,
+        unpaid_players=row.unpaid_players
+    )
 
 
 # Forecast endpoint
@@ -350,8 +536,13 @@ async def get_game_forecast(
     Uses historical average from similar games (same weekday/location).
     Can be extended to use Vertex AI for more sophisticated forecasting.
     """
-    # Get game details
-    game_result = await db.execute(select(GameSchedule).where(GameSchedule.id == game_id))
+    # Single timestamp for cache freshness, history window and computed_at
+    now = datetime.utcnow()
+
+    # Get game details (lambda statements skip rebuilding and re-keying on every call)
+    game_result = await db.execute(
+        lambda_stmt(lambda: select(GameSchedule).where(GameSchedule.id == game_id))
+    )
     game = game_result.scalar_one_or_none()
 
     if not game:
@@ -359,12 +550,12 @@ async def get_game_forecast(
 
     # Check if we have a cached forecast
     cache_result = await db.execute(
-        select(ForecastCache).where(ForecastCache.game_id == game_id)
+        lambda_stmt(lambda: select(ForecastCache).where(ForecastCache.game_id == game_id))
     )
     cached_forecast = cache_result.scalar_one_or_none()
 
     # If cache is recent (less than 24 hours old), return it
-    if cached_forecast and (datetime.utcnow() - cached_forecast.computed_at) < timedelta(hours=24):
+    if cached_forecast and (now - cached_forecast.computed_at) < timedelta(hours=24):
         return ForecastResponse(
             game_id=game.id,
             game_date=game.game_date,
@@ -372,75 +563,72 @@ async def get_game_forecast(
             forecasted_income=float(cached_forecast.forecasted_income),
             confidence_level=cached_forecast.confidence_level,
             method=cached_forecast.method,
-            historical_data=cached_forecast.metadata or {}
+            historical_data=cached_forecast.forecast_metadata or {}
         )
 
     # Otherwise, compute forecast from historical data
     game_weekday = game.game_date.weekday()
 
     # Get historical games (past completed games, same weekday/location, last 90 days)
-    historical_cutoff = datetime.utcnow() - timedelta(days=90)
+    historical_cutoff = now - timedelta(days=90)
+
+    # Postgres dow counts from Sunday = 0, Python weekday() from Monday = 0
+    game_dow = game.game_date.isoweekday() % 7
 
-    # Get historical payment data
+    # Averages over the precomputed stats view, aggregated in SQL into a single row
     historical_result = await db.execute(
         select(
-            GameSchedule.id,
-            func.count(EventPayment.id).label("payment_count"),
-            func.sum(EventPayment.amount).label("total_revenue")
+            func.avg(historical_game_stats.c.payment_count).label("avg_players"),
+            func.avg(historical_game_stats.c.total_revenue).label("avg_revenue"),
+            func.count().label("games_count")
         )
-        .outerjoin(EventPayment, and_(
-            EventPayment.game_id == GameSchedule.id,
-            EventPayment.status == "confirmed"
-        ))
         .where(
             and_(
-                GameSchedule.game_date < datetime.utcnow(),
-                GameSchedule.game_date > historical_cutoff,
-                func.extract("dow", GameSchedule.game_date) == game_weekday,
-                GameSchedule.location == game.location
+                historical_game_stats.c.location == game.location,
+                historical_game_stats.c.weekday == game_dow,
+                historical_game_stats.c.game_date > historical_cutoff,
+                historical_game_stats.c.game_date < now
             )
         )
-        .group_by(GameSchedule.id)
     )
-    historical_games = historical_result.all()
+    historical_stats = historical_result.one()
+    historical_games_count = historical_stats.games_count
 
-    if historical_games:
-        # Calculate averages
-        avg_players = sum(g.payment_count for g in historical_games) / len(historical_games)
-        avg_revenue = sum(float(g.total_revenue or 0) for g in historical_games) / len(historical_games)
-        confidence = "high" if len(historical_games) >= 5 else "medium" if len(historical_games) >= 2 else "low"
+    if historical_games_count:
+        confidence = "high" if historical_games_count >= 5 else "medium" if historical_games_count >= 2 else "low"
 
-        forecasted_players = int(round(avg_players))
-        forecasted_income = avg_revenue
+        forecasted_players = int(round(historical_stats.avg_players))
+        forecasted_income = historical_stats.avg_revenue
     else:
         # No historical data, use game settings
         forecasted_players = game.max_players or 16
-        forecasted_income = float(game.price_per_player or 0) * forecasted_players
+        forecasted_income = (game.price_per_player or Decimal(0)) * forecasted_players
         confidence = "low"
 
     # Cache the forecast
     if cached_forecast:
         cached_forecast.forecasted_players = forecasted_players
-        cached_forecast.forecasted_income = Decimal(str(forecasted_income))
+        cached_forecast.forecasted_income = forecasted_income
         cached_forecast.confidence_level = confidence
-        cached_forecast.metadata = {
-            "historical_games_count": len(historical_games),
+        cached_forecast.forecast_metadata = {
+            "historical_games_count": historical_games_count,
             "weekday": game_weekday,
             "location": game.location
         }
-        cached_forecast.computed_at = datetime.utcnow()
+        cached_forecast.computed_at = now
     else:
         cached_forecast = ForecastCache(
             game_id=game_id,
             forecasted_players=forecasted_players,
-            forecasted_income=Decimal(str(forecasted_income)),
+            forecasted_income=forecasted_income,
             confidence_level=confidence,
             method="historical_average",
-            metadata={
-                "historical_games_count": len(historical_games),
+            forecast_metadata={
+                "historical_games_count": historical_games_count,
                 "weekday": game_weekday,
                 "location": game.location
-            }
+            },
+            computed_at=now
         )
         db.add(cached_forecast)
 
@@ -450,11 +638,11 @@ async def get_game_forecast(
         game_id=game.id,
         game_date=game.game_date,
         forecasted_players=forecasted_players,
-        forecasted_income=forecasted_income,
+        forecasted_income=float(forecasted_income),
         confidence_level=confidence,
         method="historical_average",
         historical_data={
-            "historical_games_count": len(historical_games),
+            "historical_games_count": historical_games_count,
             "weekday": game_weekday,
             "location": game.location
         }
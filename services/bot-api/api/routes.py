@@ -1,9 +1,14 @@
 """FastAPI routes"""
+import time
+from urllib.parse import urlencode
 from datetime import datetime, timedelta
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import select, func
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import select, func, distinct
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from pydantic import BaseModel
 
 from db import get_db, Poll, PollVote, Player, Match, GameSchedule
@@ -11,6 +16,21 @@ from db import get_db, Poll, PollVote, Player, Match, GameSchedule
 # Create API router
 api_router = APIRouter(prefix="/api")
 
+# Cumulative vote buckets reported by /polls/{poll_id}/stats: (name, minutes since poll creation)
+VOTE_TIME_BUCKETS = [
+    ("first_minute", 1),
+    ("first_5_minutes", 5),
+    ("first_10_minutes", 10),
+    ("first_30_minutes", 30),
+    ("first_hour", 60),
+]
+
+# Response header carrying the query params of the next keyset page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Pre-serialized health body, refreshed at most once per second
+_HEALTH_CACHE = (0.0, b"")
+
 
 # Pydantic models for API responses
 class PlayerResponse(BaseModel):
@@ -52,10 +72,16 @@ class NextGamePlayersResponse(BaseModel):
     total_count: int
 
 
-@api_router.get("/health")
+@api_router.get("/health", response_class=ORJSONResponse)
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
+    global _HEALTH_CACHE
+    now = time.monotonic()
+    cached_at, body = _HEALTH_CACHE
+    if not body or now - cached_at > 1.0:
+        body = orjson.dumps({"status": "healthy", "timestamp": datetime.utcnow().isoformat()})
+        _HEALTH_CACHE = (now, body)
+    return Response(content=body, media_type="application/json")
 
 
 @api_router.get("/games/next/players", response_model=NextGamePlayersResponse)
@@ -100,29 +126,18 @@ async def get_next_game_players(
             total_count=0
         )
 
-    # Get votes for this poll ordered by voted_at (first come, first served)
+    # Get votes for this poll ordered by voted_at (first come, first served),
+    # with their players fetched in one batched SELECT
     votes_result = await db.execute(
         select(PollVote)
         .where(PollVote.poll_id == poll.poll_id)
         .order_by(PollVote.voted_at)
         .limit(limit)
+        .options(selectinload(PollVote.player))
     )
     votes = votes_result.scalars().all()
 
-    # Get player details for these votes
-    user_ids = [vote.user_id for vote in votes]
-    players_result = await db.execute(
-        select(Player)
-        .where(Player.telegram_user_id.in_(user_ids))
-    )
-    players = players_result.scalars().all()
-
-    # Create a mapping for ordered results
-    player_map = {p.telegram_user_id: p for p in players}
-    ordered_players = []
-    for vote in votes:
-        if vote.user_id in player_map:
-            ordered_players.append(player_map[vote.user_id])
+    ordered_players = [vote.player for vote in votes if vote.player]
 
     return NextGamePlayersResponse(
         game=GameResponse.model_validate(next_game),
@@ -151,42 +166,32 @@ async def get_poll_stats(
     if not poll:
         raise HTTPException(status_code=404, detail="Poll not found")
 
-    # Get all votes for this poll
-    votes_result = await db.execute(
-        select(PollVote).where(PollVote.poll_id == poll_id)
+    # Aggregate votes in a single query instead of loading every row
+    columns = [
+        func.count().label("total_votes"),
+        func.count(distinct(PollVote.user_id)).label("unique_voters"),
+    ]
+
+    # Group votes by time intervals (e.g., first 10 minutes, first hour, etc.)
+    if poll.created_at:
+        seconds_elapsed = func.extract("epoch", PollVote.voted_at - poll.created_at)
+        columns += [
+            func.count().filter(seconds_elapsed <= minutes * 60).label(bucket)
+            for bucket, minutes in VOTE_TIME_BUCKETS
+        ]
+        columns.append(func.count().filter(seconds_elapsed > 3600).label("after_hour"))
+
+    stats_result = await db.execute(
+        select(*columns).where(PollVote.poll_id == poll_id)
     )
-    votes = votes_result.scalars().all()
+    stats = stats_result.mappings().one()
 
-    # Calculate statistics
-    total_votes = len(votes)
-    unique_voters = len(set(vote.user_id for vote in votes))
+    total_votes = stats["total_votes"]
+    unique_voters = stats["unique_voters"]
 
-    # Group votes by time intervals (e.g., first 10 minutes, first hour, etc.)
-    if votes and poll.created_at:
-        votes_by_time = {
-            "first_minute": 0,
-            "first_5_minutes": 0,
-            "first_10_minutes": 0,
-            "first_30_minutes": 0,
-            "first_hour": 0,
-            "after_hour": 0,
-        }
-
-        for vote in votes:
-            time_diff = (vote.voted_at - poll.created_at).total_seconds() / 60
-
-            if time_diff <= 1:
-                votes_by_time["first_minute"] += 1
-            if time_diff <= 5:
-                votes_by_time["first_5_minutes"] += 1
-            if time_diff <= 10:
-                votes_by_time["first_10_minutes"] += 1
-            if time_diff <= 30:
-                votes_by_time["first_30_minutes"] += 1
-            if time_diff <= 60:
-                votes_by_time["first_hour"] += 1
-            else:
-                votes_by_time["after_hour"] += 1
+    if total_votes and poll.created_at:
+        votes_by_time = {bucket: stats[bucket] for bucket, _ in VOTE_TIME_BUCKETS}
+        votes_by_time["after_hour"] = stats["after_hour"]
     else:
         votes_by_time = {}
 
@@ -202,48 +207,79 @@ async def get_poll_stats(
     )
 
 
-@api_router.get("/players", response_model=List[PlayerResponse])
+@api_router.get("/players", response_class=ORJSONResponse)
 async def get_players(
     skip: int = 0,
     limit: int = 100,
+    after_id: Optional[int] = None,
     db: AsyncSession = Depends(get_db)
 ):
-    """Get list of players"""
-    result = await db.execute(
-        select(Player)
-        .offset(skip)
-        .limit(limit)
-    )
-    players = result.scalars().all()
-    return [PlayerResponse.model_validate(p) for p in players]
+    """
+    Get list of players.
+    Pass the X-Next-Cursor query params (after_id) for keyset pagination;
+    skip is kept for backwards compatibility.
+    """
+    query = select(
+        Player.id,
+        Player.telegram_user_id,
+        Player.username,
+        Player.display_name,
+        Player.skill_rating,
+        Player.preferred_position,
+    ).order_by(Player.id)
+
+    if after_id is not None:
+        query = query.where(Player.id > after_id)
+    else:
+        query = query.offset(skip)
 
+    result = await db.execute(query.limit(limit))
+    players = [dict(p) for p in result.mappings().all()]
 
-@api_router.get("/polls", response_model=List[dict])
+    response = ORJSONResponse(players)
+    if len(players) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = urlencode({"after_id": players[-1]["id"]})
+    return response
+
+
+@api_router.get("/polls", response_class=ORJSONResponse)
 async def get_polls(
     poll_type: Optional[str] = None,
     skip: int = 0,
     limit: int = 100,
+    after_id: Optional[int] = None,
     db: AsyncSession = Depends(get_db)
 ):
-    """Get list of polls"""
-    query = select(Poll)
+    """
+    Get list of polls, newest first.
+    Pass the X-Next-Cursor query param (after_id) for keyset pagination; skip is
+    kept for backwards compatibility. Polls are ordered by id, which follows
+    insertion order and, unlike created_at, is never NULL.
+    """
+    # Plain column rows - no ORM entities needed for a flat listing
+    query = select(
+        Poll.id,
+        Poll.poll_id,
+        Poll.poll_type,
+        Poll.title,
+        Poll.created_at,
+        Poll.closed_at,
+    )
 
     if poll_type:
         query = query.where(Poll.poll_type == poll_type)
 
-    query = query.order_by(Poll.created_at.desc()).offset(skip).limit(limit)
+    if after_id is not None:
+        query = query.where(Poll.id < after_id)
+    else:
+        query = query.offset(skip)
+
+    query = query.order_by(Poll.id.desc()).limit(limit)
 
     result = await db.execute(query)
-    polls = result.scalars().all()
-
-    return [
-        {
-            "id": p.id,
-            "poll_id": p.poll_id,
-            "poll_type": p.poll_type,
-            "title": p.title,
-            "created_at": p.created_at,
-            "closed_at": p.closed_at,
-        }
-        for p in polls
-    ]
+    polls = [dict(p) for p in result.mappings().all()]
+
+    response = ORJSONResponse(polls)
+    if len(polls) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = urlencode({"after_id": polls[-1]["id"]})
+    return response
@@ -1,11 +1,14 @@
 """Telegram bot handlers"""
+import asyncio
 import logging
 from datetime import datetime
-from aiogram import Router, F
+from aiogram import Router
+from aiogram.filters import Command
 from aiogram.types import (
     Update, ChatMemberUpdated, PollAnswer, Message
 )
-from sqlalchemy import select, update
+from sqlalchemy import select, update, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from db import GroupMember, PollVote, AsyncSessionLocal
@@ -16,60 +19,75 @@ logger = logging.getLogger(__name__)
 router = Router()
 
 
-async def extract_user_info(user):
-    """Extract user information from Telegram user object"""
-    return {
-        "user_id": user.id,
-        "username": user.username,
-        "display_name": f"{user.first_name} {user.last_name or ''}".strip(),
-    }
+def extract_user_info(user):
+    """Extract (user_id, username, display_name) from Telegram user object"""
+    last_name = user.last_name
+    display_name = f"{user.first_name} {last_name}" if last_name else user.first_name
+    return user.id, user.username, display_name
+
+
+async def commit_and_answer(db: AsyncSession, event: ChatMemberUpdated, text: str):
+    """
+    Commit the session while the chat message is being sent.
+    The message does not wait for the commit, so it may go out even if the commit fails.
+    """
+    commit_result, answer_result = await asyncio.gather(
+        db.commit(), event.answer(text), return_exceptions=True
+    )
+
+    if isinstance(commit_result, Exception):
+        logger.error(f"Error committing chat member update: {commit_result}", exc_info=commit_result)
+        await db.rollback()
+    if isinstance(answer_result, Exception):
+        logger.error(f"Error sending chat member message: {answer_result}", exc_info=answer_result)
 
 
 @router.chat_member()
 async def on_chat_member_updated(event: ChatMemberUpdated):
     """Handle user joining or leaving the group"""
-    user_info = await extract_user_info(event.new_chat_member.user)
+    user_id, username, display_name = extract_user_info(event.new_chat_member.user)
+    now = datetime.utcnow()
 
     async with AsyncSessionLocal() as db:
         try:
             if event.new_chat_member.status in ["member", "administrator", "creator"]:
                 # User joined or became active
-                logger.info(f"User {user_info['user_id']} joined the group")
+                logger.info(f"User {user_id} joined the group")
 
                 # Insert new member record
                 new_member = GroupMember(
-                    user_id=user_info["user_id"],
-                    username=user_info["username"],
-                    display_name=user_info["display_name"],
-                    joined_at=datetime.utcnow(),
+                    user_id=user_id,
+                    username=username,
+                    display_name=display_name,
+                    joined_at=now,
                     status="active"
                 )
                 db.add(new_member)
-                await db.commit()
 
-                # Send welcome message
-                await event.answer(
-                    f"Welcome {user_info['display_name']}! "
+                # Commit and send welcome message concurrently
+                await commit_and_answer(
+                    db, event,
+                    f"Welcome {display_name}! "
                     f"Great to have you in our volleyball community!"
                 )
 
             elif event.new_chat_member.status in ["left", "kicked"]:
                 # User left or was removed
-                logger.info(f"User {user_info['user_id']} left the group")
+                logger.info(f"User {user_id} left the group")
 
                 # Update existing member records to mark as left
                 stmt = (
                     update(GroupMember)
-                    .where(GroupMember.user_id == user_info["user_id"])
+                    .where(GroupMember.user_id == user_id)
                     .where(GroupMember.status == "active")
-                    .values(status="left", left_at=datetime.utcnow())
+                    .values(status="left", left_at=now)
                 )
                 await db.execute(stmt)
-                await db.commit()
 
-                # Send farewell message
-                await event.answer(
-                    f"Goodbye {user_info['display_name']}! "
+                # Commit and send farewell message concurrently
+                await commit_and_answer(
+                    db, event,
+                    f"Goodbye {display_name}! "
                     f"Hope to see you on the court again soon!"
                 )
         except Exception as e:
@@ -82,33 +100,29 @@ async def on_poll_answer(poll_answer: PollAnswer):
     """Handle poll answers and store them with server-side timestamp"""
     logger.info(f"Poll answer received: poll_id={poll_answer.poll_id}, user_id={poll_answer.user.id}")
 
+    if not poll_answer.option_ids:
+        # Vote retracted - nothing to record
+        return
+
+    # (poll_id, user_id) is unique, so a multi-answer poll keeps the last option
+    stmt = pg_insert(PollVote).values(
+        poll_id=poll_answer.poll_id,
+        user_id=poll_answer.user.id,
+        option_id=poll_answer.option_ids[-1],
+        voted_at=datetime.utcnow()  # Server-side timestamp
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["poll_id", "user_id"],
+        set_={
+            "option_id": stmt.excluded.option_id,
+            "voted_at": stmt.excluded.voted_at,
+        }
+    )
+
     async with AsyncSessionLocal() as db:
         try:
-            # Get the option IDs that were selected
-            for option_id in poll_answer.option_ids:
-                # Check if vote already exists
-                existing_vote = await db.execute(
-                    select(PollVote).where(
-                        PollVote.poll_id == poll_answer.poll_id,
-                        PollVote.user_id == poll_answer.user.id
-                    )
-                )
-                vote = existing_vote.scalar_one_or_none()
-
-                if vote:
-                    # Update existing vote
-                    vote.option_id = option_id
-                    vote.voted_at = datetime.utcnow()
-                else:
-                    # Create new vote with server-side timestamp
-                    new_vote = PollVote(
-                        poll_id=poll_answer.poll_id,
-                        user_id=poll_answer.user.id,
-                        option_id=option_id,
-                        voted_at=datetime.utcnow()  # Server-side timestamp
-                    )
-                    db.add(new_vote)
-
+            # Single upsert instead of SELECT + UPDATE/INSERT per option
+            await db.execute(stmt)
             await db.commit()
             logger.info(f"Poll vote saved for user {poll_answer.user.id}")
 
@@ -117,46 +131,63 @@ async def on_poll_answer(poll_answer: PollAnswer):
             await db.rollback()
 
 
-@router.message(F.text.startswith("/"))
-async def on_command(message: Message):
-    """Handle bot commands"""
-    command = message.text.split()[0].lower()
+START_TEXT = (
+    "Welcome to the Volleyball Community Bot!\n\n"
+    "I help manage our volleyball community with:\n"
+    "- Weekly trivia polls\n"
+    "- Game attendance tracking\n"
+    "- Game notifications\n\n"
+    "Stay active and have fun!"
+)
 
-    if command == "/start":
-        await message.answer(
-            "Welcome to the Volleyball Community Bot!\n\n"
-            "I help manage our volleyball community with:\n"
-            "- Weekly trivia polls\n"
-            "- Game attendance tracking\n"
-            "- Game notifications\n\n"
-            "Stay active and have fun!"
-        )
-    elif command == "/help":
-        await message.answer(
-            "Available commands:\n"
-            "/start - Start the bot\n"
-            "/help - Show this help message\n"
-            "/next - Show next game details\n"
-            "/stats - Show your stats\n"
+HELP_TEXT = (
+    "Available commands:\n"
+    "/start - Start the bot\n"
+    "/help - Show this help message\n"
+    "/next - Show next game details\n"
+    "/stats - Show your stats\n"
+)
+
+# This would fetch from database
+NEXT_TEXT = (
+    "Next game information will be posted here!\n"
+    "Check back soon for details."
+)
+
+
+@router.message(Command("start", ignore_case=True))
+async def cmd_start(message: Message):
+    """Greet the user"""
+    await message.answer(START_TEXT)
+
+
+@router.message(Command("help", ignore_case=True))
+async def cmd_help(message: Message):
+    """List available commands"""
+    await message.answer(HELP_TEXT)
+
+
+@router.message(Command("next", ignore_case=True))
+async def cmd_next(message: Message):
+    """Show next game details"""
+    await message.answer(NEXT_TEXT)
+
+
+@router.message(Command("stats", ignore_case=True))
+async def cmd_stats(message: Message):
+    """Reply with the sender's poll statistics"""
+    async with AsyncSessionLocal() as db:
+        # Count user's poll votes (served by idx_poll_votes_user_id)
+        vote_count = await db.scalar(
+            select(func.count())
+            .select_from(PollVote)
+            .where(PollVote.user_id == message.from_user.id)
         )
-    elif command == "/next":
-        # This would fetch from database
+
         await message.answer(
-            "Next game information will be posted here!\n"
-            "Check back soon for details."
+            f"Your stats:\n"
+            f"Total poll votes: {vote_count}"
         )
-    elif command == "/stats":
-        async with AsyncSessionLocal() as db:
-            # Count user's poll votes
-            result = await db.execute(
-                select(PollVote).where(PollVote.user_id == message.from_user.id)
-            )
-            vote_count = len(result.scalars().all())
-
-            await message.answer(
-                f"Your stats:\n"
-                f"Total poll votes: {vote_count}"
-            )
 
 
 @router.message()
@@ -1,44 +1,132 @@
 """Payment-related bot commands"""
+import asyncio
 import logging
 import re
-from datetime import datetime, timedelta
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Tuple
 from aiogram import Router, F
 from aiogram.types import Message
-from aiogram.filters import Command
-from sqlalchemy import select, and_
+from aiogram.filters import Command, CommandObject
+from sqlalchemy import select, delete, and_, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only, raiseload
 from decimal import Decimal
 
+from config import settings
 from db import AsyncSessionLocal, GameSchedule, Player, EventPayment
-from api.payments import get_game_budget, get_game_forecast
+from api.payments import (
+    get_game_budget, get_game_budget_summary, get_game_forecast, invalidate_budget_cache
+)
 
 logger = logging.getLogger(__name__)
 
 # Create router for payment commands
 payment_command_router = Router()
 
+# Loader options for the columns the command replies actually use
+GAME_LOAD_OPTIONS = [
+    load_only(GameSchedule.id, GameSchedule.game_date, GameSchedule.location, GameSchedule.price_per_player),
+    raiseload("*"),
+]
+PLAYER_LOAD_OPTIONS = [
+    load_only(Player.id, Player.username, Player.display_name),
+    raiseload("*"),
+]
+
+# Reply formats
+GAME_DATE_FMT = "%A, %B %d at %I:%M %p"
+PAYMENT_DATE_FMT = "%Y-%m-%d"
+BUDGET_TEMPLATE = (
+    "📊 Budget for {location}\n"
+    "📅 {date}\n"
+    "\n"
+    "💵 Price per player: {budget.price_per_player:.2f} ILS\n"
+    "👥 Registered: {budget.registered_players}\n"
+    "✅ Paid: {budget.number_of_payers}\n"
+    "❌ Unpaid: {budget.unpaid_players}\n"
+    "\n"
+    "💰 Expected income: {budget.expected_income:.2f} ILS\n"
+    "✅ Actual income: {budget.actual_income:.2f} ILS\n"
+    "📈 Collection rate: {collection_rate:.1f}%"
+)
+
+# Today's game cache: UTC date -> (game id or None, monotonic timestamp).
+# Per process, so it is disabled when uvicorn runs several workers
+TODAY_GAME_CACHE_TTL_SECONDS = 60 if settings.api_workers == 1 else 0
+_today_game_cache: Dict[date, Tuple[Optional[int], float]] = {}
+# Lookups in progress: UTC date -> future resolving to the game id or None
+_today_game_inflight: Dict[date, asyncio.Future] = {}
+
+# Command arguments: [<game_id>] <@username> [<amount>]
+MARK_PAID_RE = re.compile(r"^\s*(?:(\d+)\s+)?(@?[^\W\d]\w*)(?:\s+(\d+(?:\.\d+)?))?\s*$")
+# Command arguments: [<game_id>] [<@username>]
+MARK_UNPAID_RE = re.compile(r"^\s*(?:(\d+)(?:\s+|$))?(@?[^\W\d]\w*)?\s*$")
+
+
+async def get_game_by_id(db: AsyncSession, game_id: Optional[int]):
+    """Helper to load a game by primary key (None passes through)"""
+    if game_id is None:
+        return None
+    return await db.get(GameSchedule, game_id, options=GAME_LOAD_OPTIONS)
+
 
 async def get_today_game(db: AsyncSession):
     """Helper to find today's game"""
     today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
     today_end = today_start + timedelta(days=1)
-
-    result = await db.execute(
-        select(GameSchedule).where(
-            and_(
-                GameSchedule.game_date >= today_start,
-                GameSchedule.game_date < today_end
-            )
-        ).order_by(GameSchedule.game_date)
-    )
-    return result.scalar_one_or_none()
+    today = today_start.date()
+
+    # Serve the game id from the cache and load the row by primary key
+    cached = _today_game_cache.get(today)
+    if cached and time.monotonic() - cached[1] < TODAY_GAME_CACHE_TTL_SECONDS:
+        return await get_game_by_id(db, cached[0])
+
+    # Another command is already looking today's game up - share its result
+    inflight = _today_game_inflight.get(today)
+    if inflight:
+        return await get_game_by_id(db, await asyncio.shield(inflight))
+
+    inflight = asyncio.get_running_loop().create_future()
+    _today_game_inflight[today] = inflight
+    try:
+        # Sargable range on idx_game_schedule_game_date; first game of the day wins
+        result = await db.execute(
+            select(GameSchedule).where(
+                and_(
+                    GameSchedule.game_date >= today_start,
+                    GameSchedule.game_date < today_end
+                )
+            ).order_by(GameSchedule.game_date)
+            .limit(1)
+            .options(*GAME_LOAD_OPTIONS)
+        )
+        game = result.scalar_one_or_none()
+        game_id = game.id if game else None
+        inflight.set_result(game_id)
+    except Exception as e:
+        inflight.set_exception(e)
+        # Mark the exception as retrieved in case nobody was waiting
+        inflight.exception()
+        raise
+    finally:
+        del _today_game_inflight[today]
+        if not inflight.done():
+            inflight.cancel()
+
+    # Only today's entry is ever needed
+    _today_game_cache.clear()
+    _today_game_cache[today] = (game_id, time.monotonic())
+
+    return game
 
 
 async def find_player_by_username(db: AsyncSession, username: str):
     """Helper to find player by username (with or without @)"""
     username = username.lstrip("@")
     result = await db.execute(
-        select(Player).where(Player.username == username)
+        select(Player).where(Player.username == username).options(*PLAYER_LOAD_OPTIONS)
     )
     return result.scalar_one_or_none()
 
@@ -53,9 +141,17 @@ async def cmd_who_paid(message: Message):
             await message.answer("No game scheduled for today.")
             return
 
-        # Get all confirmed payments
+        # Get all confirmed payments with their players, totals computed alongside
         result = await db.execute(
-            select(EventPayment, Player)
+            select(
+                Player.id,
+                Player.display_name,
+                Player.username,
+                EventPayment.amount,
+                EventPayment.currency,
+                func.sum(EventPayment.amount).over().label("total"),
+                func.max(EventPayment.currency).over().label("total_currency")
+            )
             .join(Player, EventPayment.player_id == Player.id)
             .where(
                 and_(
@@ -72,16 +168,15 @@ async def cmd_who_paid(message: Message):
             return
 
         # Format response
-        response = f"💰 Paid Players ({len(payments)}):\n\n"
-        total = 0
-        for idx, (payment, player) in enumerate(payments, 1):
-            name = player.display_name or player.username or f"Player {player.id}"
-            response += f"{idx}. {name} - {float(payment.amount):.2f} {payment.currency}\n"
-            total += float(payment.amount)
+        lines = [f"💰 Paid Players ({len(payments)}):", ""]
+        for idx, payment in enumerate(payments, 1):
+            name = payment.display_name or payment.username or f"Player {payment.id}"
+            lines.append(f"{idx}. {name} - {payment.amount:.2f} {payment.currency}")
 
-        response += f"\n💵 Total collected: {total:.2f} {payments[0][0].currency if payments else 'ILS'}"
+        lines.append("")
+        lines.append(f"💵 Total collected: {payments[0].total:.2f} {payments[0].total_currency}")
 
-        await message.answer(response)
+        await message.answer("\n".join(lines))
 
 
 @payment_command_router.message(Command("who_not_paid"))
@@ -103,15 +198,16 @@ async def cmd_who_not_paid(message: Message):
                 return
 
             # Format response
-            response = f"⚠️ Unpaid Players ({len(budget.unpaid_players)}):\n\n"
+            lines = [f"⚠️ Unpaid Players ({len(budget.unpaid_players)}):", ""]
             for idx, player in enumerate(budget.unpaid_players, 1):
                 name = player.display_name or player.username or f"Player {player.player_id}"
                 amount = player.amount_due if player.amount_due else 0
-                response += f"{idx}. {name} - {amount:.2f} ILS due\n"
+                lines.append(f"{idx}. {name} - {amount:.2f} ILS due")
 
-            response += f"\n💰 Expected: {len(budget.unpaid_players) * budget.price_per_player:.2f} ILS"
+            lines.append("")
+            lines.append(f"💰 Expected: {len(budget.unpaid_players) * budget.price_per_player:.2f} ILS")
 
-            await message.answer(response)
+            await message.answer("\n".join(lines))
 
         except Exception as e:
             logger.error(f"Error getting unpaid players: {e}", exc_info=True)
@@ -129,21 +225,16 @@ async def cmd_budget_today(message: Message):
             return
 
         try:
-            budget = await get_game_budget(game.id, db)
-
-            response = f"📊 Budget for {game.location}\n"
-            response += f"📅 {game.game_date.strftime('%A, %B %d at %I:%M %p')}\n\n"
-            response += f"💵 Price per player: {budget.price_per_player:.2f} ILS\n"
-            response += f"👥 Registered: {budget.registered_players}\n"
-            response += f"✅ Paid: {budget.number_of_payers}\n"
-            response += f"❌ Unpaid: {len(budget.unpaid_players)}\n\n"
-            response += f"💰 Expected income: {budget.expected_income:.2f} ILS\n"
-            response += f"✅ Actual income: {budget.actual_income:.2f} ILS\n"
+            budget = await get_game_budget_summary(game.id, db)
 
             collection_rate = (budget.actual_income / budget.expected_income * 100) if budget.expected_income > 0 else 0
-            response += f"📈 Collection rate: {collection_rate:.1f}%"
 
-            await message.answer(response)
+            await message.answer(BUDGET_TEMPLATE.format(
+                location=game.location,
+                date=game.game_date.strftime(GAME_DATE_FMT),
+                budget=budget,
+                collection_rate=collection_rate
+            ))
 
         except Exception as e:
             logger.error(f"Error getting budget: {e}", exc_info=True)
@@ -164,7 +255,7 @@ async def cmd_forecast_today(message: Message):
             forecast = await get_game_forecast(game.id, db)
 
             response = f"🔮 Forecast for {game.location}\n"
-            response += f"📅 {game.game_date.strftime('%A, %B %d at %I:%M %p')}\n\n"
+            response += f"📅 {game.game_date.strftime(GAME_DATE_FMT)}\n\n"
             response += f"👥 Expected players: {forecast.forecasted_players}\n"
             response += f"💰 Expected income: {forecast.forecasted_income:.2f} ILS\n"
             response += f"📊 Confidence: {forecast.confidence_level}\n"
@@ -183,16 +274,16 @@ async def cmd_forecast_today(message: Message):
 
 # Admin commands for marking payments
 @payment_command_router.message(Command("mark_paid"))
-async def cmd_mark_paid(message: Message):
+async def cmd_mark_paid(message: Message, command: CommandObject):
     """
     Mark a player as paid for a game.
     Usage: /mark_paid <game_id> <@username> <amount>
     Or: /mark_paid <@username> <amount> (for today's game)
     """
-    # Parse command
-    parts = message.text.split()
+    # Parse command arguments
+    match = MARK_PAID_RE.match(command.args or "")
 
-    if len(parts) < 3:
+    if not match:
         await message.answer(
             "Usage: /mark_paid <game_id> <@username> <amount>\n"
             "Or: /mark_paid <@username> <amount> (for today's game)"
@@ -201,19 +292,16 @@ async def cmd_mark_paid(message: Message):
 
     async with AsyncSessionLocal() as db:
         try:
-            # Determine if game_id is provided
-            if parts[1].isdigit() and not parts[1].startswith("@"):
-                game_id = int(parts[1])
-                username = parts[2]
-                amount = float(parts[3]) if len(parts) > 3 else 0
+            game_id, username, amount = match.groups()
+            # The pattern only admits plain decimal numbers, so this cannot fail
+            amount = Decimal(amount) if amount else Decimal(0)
 
-                game_result = await db.execute(select(GameSchedule).where(GameSchedule.id == game_id))
-                game = game_result.scalar_one_or_none()
+            # Determine if game_id is provided
+            if game_id:
+                game = await get_game_by_id(db, int(game_id))
             else:
                 # Use today's game
                 game = await get_today_game(db)
-                username = parts[1]
-                amount = float(parts[2]) if len(parts) > 2 else 0
 
             if not game:
                 await message.answer("Game not found.")
@@ -221,7 +309,7 @@ async def cmd_mark_paid(message: Message):
 
             # Use default price if amount not specified
             if amount == 0:
-                amount = float(game.price_per_player) if game.price_per_player else 0
+                amount = game.price_per_player or Decimal(0)
 
             # Find player
             player = await find_player_by_username(db, username)
@@ -230,43 +318,36 @@ async def cmd_mark_paid(message: Message):
                 await message.answer(f"Player {username} not found in database.")
                 return
 
-            # Check if payment already exists
-            existing = await db.execute(
-                select(EventPayment).where(
-                    and_(
-                        EventPayment.game_id == game.id,
-                        EventPayment.player_id == player.id
-                    )
+            # Create payment, skipping it if one already exists
+            result = await db.execute(
+                pg_insert(EventPayment)
+                .values(
+                    game_id=game.id,
+                    player_id=player.id,
+                    amount=amount,
+                    currency="ILS",
+                    method="paybox",
+                    status="confirmed",
+                    paid_at=datetime.utcnow()
                 )
+                .on_conflict_do_nothing(index_elements=["game_id", "player_id"])
+                .returning(EventPayment.id)
             )
 
-            if existing.scalar_one_or_none():
+            if result.scalar_one_or_none() is None:
                 await message.answer(f"Payment already recorded for {username}.")
                 return
 
-            # Create payment
-            payment = EventPayment(
-                game_id=game.id,
-                player_id=player.id,
-                amount=Decimal(str(amount)),
-                currency="ILS",
-                method="paybox",
-                status="confirmed",
-                paid_at=datetime.utcnow()
-            )
-
-            db.add(payment)
             await db.commit()
+            invalidate_budget_cache(game.id)
 
             await message.answer(
                 f"✅ Payment recorded:\n"
                 f"Player: {player.display_name or player.username}\n"
                 f"Amount: {amount:.2f} ILS\n"
-                f"Game: {game.game_date.strftime('%Y-%m-%d')}"
+                f"Game: {game.game_date.strftime(PAYMENT_DATE_FMT)}"
             )
 
-        except ValueError:
-            await message.answer("Invalid amount. Please provide a valid number.")
         except Exception as e:
             logger.error(f"Error marking payment: {e}", exc_info=True)
             await message.answer("Error recording payment.")
@@ -274,15 +355,16 @@ async def cmd_mark_paid(message: Message):
 
 
 @payment_command_router.message(Command("mark_unpaid"))
-async def cmd_mark_unpaid(message: Message):
+async def cmd_mark_unpaid(message: Message, command: CommandObject):
     """
     Remove payment record (mark as unpaid).
     Usage: /mark_unpaid <game_id> <@username>
     Or: /mark_unpaid <@username> (for today's game)
     """
-    parts = message.text.split()
+    # Parse command arguments
+    match = MARK_UNPAID_RE.match(command.args or "")
 
-    if len(parts) < 2:
+    if not match or not any(match.groups()):
         await message.answer(
             "Usage: /mark_unpaid <game_id> <@username>\n"
             "Or: /mark_unpaid <@username> (for today's game)"
@@ -291,16 +373,13 @@ async def cmd_mark_unpaid(message: Message):
 
     async with AsyncSessionLocal() as db:
         try:
-            # Determine if game_id is provided
-            if parts[1].isdigit() and not parts[1].startswith("@"):
-                game_id = int(parts[1])
-                username = parts[2] if len(parts) > 2 else None
+            game_id, username = match.groups()
 
-                game_result = await db.execute(select(GameSchedule).where(GameSchedule.id == game_id))
-                game = game_result.scalar_one_or_none()
+            # Determine if game_id is provided
+            if game_id:
+                game = await get_game_by_id(db, int(game_id))
             else:
                 game = await get_today_game(db)
-                username = parts[1]
 
             if not game:
                 await message.answer("Game not found.")
@@ -317,28 +396,29 @@ async def cmd_mark_unpaid(message: Message):
                 await message.answer(f"Player {username} not found.")
                 return
 
-            # Find and delete payment
+            # Delete payment
             result = await db.execute(
-                select(EventPayment).where(
+                delete(EventPayment)
+                .where(
                     and_(
                         EventPayment.game_id == game.id,
                         EventPayment.player_id == player.id
                     )
                 )
+                .returning(EventPayment.id)
             )
-            payment = result.scalar_one_or_none()
 
-            if not payment:
+            if result.scalar_one_or_none() is None:
                 await message.answer(f"No payment found for {username}.")
                 return
 
-            await db.delete(payment)
             await db.commit()
+            invalidate_budget_cache(game.id)
 
             await message.answer(
                 f"❌ Payment removed:\n"
                 f"Player: {player.display_name or player.username}\n"
-                f"Game: {game.game_date.strftime('%Y-%m-%d')}"
+                f"Game: {game.game_date.strftime(PAYMENT_DATE_FMT)}"
             )
 
         except Exception as e:
@@ -1,9 +1,45 @@
 """Application configuration"""
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 from typing import Optional
 from pydantic_settings import BaseSettings
 from google.cloud import secretmanager
 
+# Decoded secrets are cached on local disk so warm restarts skip Secret Manager
+SECRET_CACHE_DIR = Path(os.getenv("SECRET_CACHE_DIR", "/tmp"))
+SECRET_CACHE_TTL_SECONDS = 3600
+
+# Secret Manager secret id -> Settings attribute it populates
+SECRET_ATTRIBUTES = {
+    "telegram-bot-token": "telegram_bot_token",
+    "db-password": "database_password",
+}
+
+
+def read_cached_secret(secret_id: str) -> Optional[str]:
+    """Return a locally cached secret if it is fresh enough"""
+    path = SECRET_CACHE_DIR / f"secret-{secret_id}"
+    try:
+        if time.time() - path.stat().st_mtime < SECRET_CACHE_TTL_SECONDS:
+            return path.read_text()
+    except OSError:
+        pass
+    return None
+
+
+def write_cached_secret(secret_id: str, value: str):
+    """Cache a secret on local disk, readable by the owner only"""
+    path = SECRET_CACHE_DIR / f"secret-{secret_id}"
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.fchmod(fd, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(value)
+    except OSError as e:
+        print(f"Warning: Could not cache {secret_id}: {e}")
+
 
 class Settings(BaseSettings):
     """Application settings"""
@@ -29,10 +65,13 @@ class Settings(BaseSettings):
     database_user: str = os.getenv("DB_USER", "volleyball_app")
     database_password: Optional[str] = None
     cloudsql_connection_name: Optional[str] = os.getenv("CLOUDSQL_CONNECTION_NAME")
+    db_pool_size: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    db_max_overflow: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
 
     # API
     api_host: str = os.getenv("API_HOST", "0.0.0.0")
     api_port: int = int(os.getenv("API_PORT", "8080"))
+    api_workers: int = int(os.getenv("WEB_CONCURRENCY", "1"))
 
     # Vertex AI
     vertex_ai_location: str = os.getenv("VERTEX_AI_LOCATION", "us-central1")
@@ -47,26 +86,41 @@ class Settings(BaseSettings):
         if not self.project_id:
             return
 
+        # Secrets still missing: secret id -> settings attribute
+        missing = {
+            secret_id: attr for secret_id, attr in SECRET_ATTRIBUTES.items()
+            if not getattr(self, attr)
+        }
+
+        # Reuse secrets fetched by a previous start of this container
+        for secret_id, attr in list(missing.items()):
+            value = read_cached_secret(secret_id)
+            if value:
+                setattr(self, attr, value)
+                del missing[secret_id]
+        if not missing:
+            return
+
         try:
             client = secretmanager.SecretManagerServiceClient()
 
-            # Load Telegram bot token
-            if not self.telegram_bot_token:
-                try:
-                    name = f"projects/{self.project_id}/secrets/telegram-bot-token/versions/latest"
-                    response = client.access_secret_version(request={"name": name})
-                    self.telegram_bot_token = response.payload.data.decode("UTF-8")
-                except Exception as e:
-                    print(f"Warning: Could not load telegram-bot-token from Secret Manager: {e}")
-
-            # Load database password
-            if not self.database_password:
-                try:
-                    name = f"projects/{self.project_id}/secrets/db-password/versions/latest"
-                    response = client.access_secret_version(request={"name": name})
-                    self.database_password = response.payload.data.decode("UTF-8")
-                except Exception as e:
-                    print(f"Warning: Could not load db-password from Secret Manager: {e}")
+            def fetch(secret_id: str) -> str:
+                name = f"projects/{self.project_id}/secrets/{secret_id}/versions/latest"
+                response = client.access_secret_version(request={"name": name})
+                return response.payload.data.decode("UTF-8")
+
+            # Fetch the secrets concurrently - each one is an independent RPC
+            with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+                futures = {executor.submit(fetch, secret_id): secret_id for secret_id in missing}
+                for future in as_completed(futures):
+                    secret_id = futures[future]
+                    try:
+                        value = future.result()
+                    except Exception as e:
+                        print(f"Warning: Could not load {secret_id} from Secret Manager: {e}")
+                        continue
+                    setattr(self, missing[secret_id], value)
+                    write_cached_secret(secret_id, value)
 
         except Exception as e:
             print(f"Error initializing Secret Manager client: {e}")
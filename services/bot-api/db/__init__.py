@@ -3,7 +3,8 @@ from .database import get_db, AsyncSessionLocal
 from .models import (
     Base, Player, Team, TeamMember, Match, Poll,
     GameSchedule, GroupMember, PollVote, JobDefinition,
-    JobSchedule, JobRun, EventPayment, BudgetCache, ForecastCache
+    JobSchedule, JobRun, EventPayment, BudgetCache, ForecastCache,
+    TriviaQuestion, historical_game_stats
 )
 
 __all__ = [
@@ -24,4 +25,6 @@ __all__ = [
     "EventPayment",
     "BudgetCache",
     "ForecastCache",
+    "TriviaQuestion",
+    "historical_game_stats",
 ]
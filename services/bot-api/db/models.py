@@ -2,8 +2,8 @@
 from datetime import datetime
 from typing import Optional
 from sqlalchemy import (
-    BigInteger, Boolean, Column, DateTime, Float, ForeignKey,
-    Integer, String, Text, JSON, CheckConstraint, Index, Numeric
+    BigInteger, Boolean, Column, Computed, DateTime, Float, ForeignKey,
+    Integer, SmallInteger, String, Text, JSON, CheckConstraint, Index, Numeric, Table
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
@@ -24,6 +24,8 @@ class Player(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     team_memberships = relationship("TeamMember", back_populates="player")
+    # Rows are removed by the ON DELETE CASCADE foreign key, not loaded and nulled
+    payments = relationship("EventPayment", back_populates="player", passive_deletes=True)
 
 
 class Team(Base):
@@ -108,11 +110,21 @@ class GameSchedule(Base):
     price_per_player = Column(Numeric(8, 2), default=0)
     max_players = Column(Integer, nullable=True)
     expected_budget = Column(Numeric(10, 2), nullable=True)
+    # Postgres day of week (0 = Sunday), maintained by the database
+    game_weekday = Column(SmallInteger, Computed("EXTRACT(dow FROM game_date)::smallint", persisted=True))
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     payments = relationship("EventPayment", back_populates="game")
 
+    __table_args__ = (
+        Index("idx_game_schedule_location_weekday_date", "location", "game_weekday", "game_date"),
+        Index(
+            "idx_game_schedule_unnotified_game_date", "game_date",
+            postgresql_where=~notified
+        ),
+    )
+
 
 class GroupMember(Base):
     __tablename__ = "group_members"
@@ -140,9 +152,17 @@ class PollVote(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
     poll = relationship("Poll", back_populates="votes")
+    player = relationship(
+        "Player",
+        primaryjoin="foreign(PollVote.user_id) == Player.telegram_user_id",
+        lazy="raise",
+        viewonly=True,
+    )
 
     __table_args__ = (
         Index("idx_poll_votes_unique", "poll_id", "user_id", unique=True),
+        Index("idx_poll_votes_poll_option", "poll_id", "option_id"),
+        Index("idx_poll_votes_poll_voted_at", "poll_id", "voted_at"),
     )
 
 
@@ -219,12 +239,13 @@ class EventPayment(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     game = relationship("GameSchedule", back_populates="payments")
-    player = relationship("Player")
+    player = relationship("Player", back_populates="payments")
 
     __table_args__ = (
         CheckConstraint("status IN ('pending', 'confirmed', 'refunded')"),
         CheckConstraint("amount >= 0"),
         Index("idx_event_payments_unique", "game_id", "player_id", unique=True),
+        Index("idx_event_payments_game_status_paid_at", "game_id", "status", "paid_at"),
     )
 
 
@@ -240,6 +261,7 @@ class BudgetCache(Base):
     registered_players = Column(Integer, nullable=True)
     paid_players_list = Column(JSON, nullable=True)
     unpaid_players_list = Column(JSON, nullable=True)
+    input_digest = Column(String(64), nullable=True)
     computed_at = Column(DateTime, default=datetime.utcnow)
 
     game = relationship("GameSchedule")
@@ -254,7 +276,35 @@ class ForecastCache(Base):
     forecasted_income = Column(Numeric(10, 2), nullable=True)
     confidence_level = Column(String(20), default="medium")
     method = Column(String(50), default="historical_average")
-    forecast_metadata = Column(JSON, nullable=True)
+    # "metadata" is reserved on declarative classes, so the attribute is renamed
+    forecast_metadata = Column("metadata", JSON, nullable=True)
     computed_at = Column(DateTime, default=datetime.utcnow)
 
     game = relationship("GameSchedule")
+
+
+class TriviaQuestion(Base):
+    __tablename__ = "trivia_questions"
+
+    id = Column(Integer, primary_key=True)
+    topic = Column(String(100), nullable=False)
+    question = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    used_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("idx_trivia_questions_unused", "id", postgresql_where=used_at.is_(None)),
+    )
+
+
+# Materialized view (migrations/007), refreshed by the budget_analytics job
+historical_game_stats = Table(
+    "mv_historical_game_stats",
+    Base.metadata,
+    Column("game_id", Integer, primary_key=True),
+    Column("game_date", DateTime),
+    Column("weekday", Integer),
+    Column("location", String(100)),
+    Column("payment_count", Integer),
+    Column("total_revenue", Numeric(10, 2)),
+)
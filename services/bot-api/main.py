@@ -1,6 +1,8 @@
 """Main application entry point"""
+import asyncio
 import logging
 import sys
+from typing import Set
 from contextlib import asynccontextmanager
 
 from aiogram import Bot, Dispatcher
@@ -26,29 +28,46 @@ logger = logging.getLogger(__name__)
 # Initialize bot and dispatcher
 bot = Bot(token=settings.telegram_bot_token)
 dp = Dispatcher()
-dp.include_router(bot_router)
+# Payment commands go first so bot_router's catch-all message handler stays last
 dp.include_router(payment_command_router)
+dp.include_router(bot_router)
 
+# Updates are processed after the webhook has been acknowledged
+WEBHOOK_MAX_CONCURRENT_UPDATES = 200
+WEBHOOK_MAX_CONNECTIONS = 100
+_webhook_semaphore = asyncio.Semaphore(WEBHOOK_MAX_CONCURRENT_UPDATES)
+_webhook_tasks: Set[asyncio.Task] = set()
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """Lifespan context manager for startup and shutdown events"""
-    # Startup
-    logger.info("Starting application...")
 
-    # Set webhook if URL is provided
+async def register_webhook():
+    """Point the Telegram webhook at this service, if a URL is configured"""
     if settings.telegram_webhook_url:
         webhook_url = f"{settings.telegram_webhook_url}{settings.telegram_webhook_path}"
         logger.info(f"Setting webhook to: {webhook_url}")
-        await bot.set_webhook(webhook_url)
+        await bot.set_webhook(webhook_url, max_connections=WEBHOOK_MAX_CONNECTIONS)
     else:
         logger.warning("No webhook URL provided, webhook not set")
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Lifespan context manager for startup and shutdown events"""
+    # Startup
+    logger.info("Starting application...")
+
+    # With several workers main() registers the webhook once, before they start
+    if settings.api_workers == 1:
+        await register_webhook()
+
     yield
 
     # Shutdown
     logger.info("Shutting down application...")
-    await bot.delete_webhook()
+    # Let updates that were already acknowledged finish
+    if _webhook_tasks:
+        await asyncio.gather(*_webhook_tasks, return_exceptions=True)
+    # The webhook is left in place: deleting it here would stop update delivery
+    # for every other worker and replica until the next full restart
     await bot.session.close()
 
 
@@ -75,6 +94,15 @@ async def root():
     }
 
 
+async def process_update(update: Update):
+    """Feed an update to the dispatcher, bounded by the webhook semaphore"""
+    async with _webhook_semaphore:
+        try:
+            await dp.feed_update(bot, update)
+        except Exception as e:
+            logger.error(f"Error processing update {update.update_id}: {e}", exc_info=True)
+
+
 @app.post(settings.telegram_webhook_path)
 async def telegram_webhook(request: Request):
     """
@@ -82,9 +110,14 @@ async def telegram_webhook(request: Request):
     Receives updates from Telegram and processes them.
     """
     try:
-        update_dict = await request.json()
-        update = Update(**update_dict)
-        await dp.feed_update(bot, update)
+        # Validate straight from the raw body - pydantic-core parses the JSON itself
+        update = Update.model_validate_json(await request.body(), context={"bot": bot})
+
+        # Ack Telegram right away; handlers run in the background
+        task = asyncio.create_task(process_update(update))
+        _webhook_tasks.add(task)
+        task.add_done_callback(_webhook_tasks.discard)
+
         return JSONResponse(content={"ok": True})
     except Exception as e:
         logger.error(f"Error processing webhook: {e}", exc_info=True)
@@ -108,6 +141,14 @@ async def ready():
     return {"status": "ready"}
 
 
+async def _register_webhook_once():
+    """Register the webhook from the supervisor process, then release its session"""
+    try:
+        await register_webhook()
+    finally:
+        await bot.session.close()
+
+
 def main():
     """Main entry point"""
     logger.info(f"Starting bot-api service on {settings.api_host}:{settings.api_port}")
@@ -123,11 +164,18 @@ def main():
         logger.error("Database password not configured!")
         sys.exit(1)
 
-    # Run the application
+    if settings.api_workers > 1:
+        asyncio.run(_register_webhook_once())
+
+    # Run the application. Multiple workers need an import string so each
+    # process builds its own app, bot and dispatcher.
     uvicorn.run(
-        app,
+        app if settings.api_workers == 1 else "main:app",
         host=settings.api_host,
         port=settings.api_port,
+        workers=settings.api_workers,
+        loop="uvloop",
+        http="httptools",
         log_level="info" if not settings.debug else "debug",
     )
 
@@ -0,0 +1,57 @@
+"""Keyset pagination of GET /api/polls"""
+import asyncio
+from datetime import datetime
+from urllib.parse import parse_qs
+
+import orjson
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from api.routes import NEXT_CURSOR_HEADER, get_polls
+from db import Poll
+
+
+class SessionAdapter:
+    """Just enough of AsyncSession for get_polls, backed by a sync SQLite session"""
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    async def execute(self, statement):
+        return self.session.execute(statement)
+
+
+def fetch_page(session: Session, limit: int, after_id=None):
+    response = asyncio.run(
+        get_polls(
+            poll_type=None, skip=0, limit=limit, after_id=after_id,
+            db=SessionAdapter(session)
+        )
+    )
+    cursor = response.headers.get(NEXT_CURSOR_HEADER)
+    return orjson.loads(response.body), cursor and parse_qs(cursor)
+
+
+def test_null_created_at_at_page_boundary():
+    engine = create_engine("sqlite://")
+    Poll.__table__.create(engine)
+
+    with Session(engine) as session:
+        session.add_all([
+            Poll(id=1, poll_id="p1", poll_type="trivia", title="one", created_at=datetime(2024, 1, 1)),
+            Poll(id=2, poll_id="p2", poll_type="trivia", title="two", created_at=None),
+            Poll(id=3, poll_id="p3", poll_type="trivia", title="three", created_at=datetime(2024, 1, 3)),
+        ])
+        session.commit()
+        # The Python-side default fills created_at on insert; clear it for poll 2
+        session.execute(Poll.__table__.update().where(Poll.id == 2).values(created_at=None))
+        session.commit()
+
+        first_page, cursor = fetch_page(session, limit=2)
+        assert [poll["id"] for poll in first_page] == [3, 2]
+        assert first_page[1]["created_at"] is None
+        assert cursor == {"after_id": ["2"]}
+
+        second_page, cursor = fetch_page(session, limit=2, after_id=int(cursor["after_id"][0]))
+        assert [poll["id"] for poll in second_page] == [1]
+        assert cursor is None
@@ -3,23 +3,29 @@
 Budget analytics job - precomputes budget and forecast metrics.
 
 This job:
-1. Finds upcoming games (next 7 days)
-2. Computes budget metrics (expected vs actual income, paid/unpaid players)
-3. Computes forecast metrics (expected attendance/revenue)
-4. Caches results in budget_cache and forecast_cache tables
-5. Records job execution in job_runs
+1. Refreshes the mv_historical_game_stats materialized view
+2. Finds upcoming games (next 7 days)
+3. Computes budget metrics (expected vs actual income, paid/unpaid players)
+4. Computes forecast metrics (expected attendance/revenue)
+5. Caches results in budget_cache and forecast_cache tables
+6. Records job execution in job_runs
 """
 import asyncio
+import hashlib
 import logging
 import sys
 import os
 from datetime import datetime, timedelta
 from decimal import Decimal
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../bot-api"))
 
-from sqlalchemy import select, and_, func
+from sqlalchemy import select, and_, func, text, literal, null, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Row
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from db.models import (
@@ -30,79 +36,89 @@ from db.models import (
     PollVote,
     BudgetCache,
     ForecastCache,
+    historical_game_stats,
 )
 from db.database import AsyncSessionLocal
-from common import JobConfig, record_job_run, get_db_session
+from common import arecord_job_run
 
 logger = logging.getLogger(__name__)
 
+# Bump to force every budget_cache row to be rewritten after a logic change
+BUDGET_INPUT_DIGEST_VERSION = 1
 
-async def compute_budget_for_game(db: AsyncSession, game: GameSchedule) -> dict:
-    """Compute budget metrics for a single game"""
+# (Postgres day of week, location) -> (avg players, avg revenue, games count)
+HistoricalStats = Dict[Tuple[int, str], Tuple[float, Decimal, int]]
 
-    # Get all confirmed payments
-    payments_result = await db.execute(
-        select(EventPayment, Player)
-        .join(Player, EventPayment.player_id == Player.id)
-        .where(
-            and_(EventPayment.game_id == game.id, EventPayment.status == "confirmed")
-        )
-    )
-    payments_with_players = payments_result.all()
-
-    # Calculate actual income
-    actual_income = sum(float(payment.amount) for payment, _ in payments_with_players)
-    number_of_payers = len(payments_with_players)
 
-    # Get registered players from game poll
-    poll_result = await db.execute(
-        select(Poll)
-        .where(and_(Poll.game_id == game.id, Poll.poll_type == "game"))
-        .order_by(Poll.created_at.desc())
-    )
-    poll = poll_result.scalar_one_or_none()
-
-    registered_count = 0
+async def refresh_historical_game_stats(db: AsyncSession) -> Optional[str]:
+    """
+    Refresh the materialized view that backs forecast lookups.
+    On failure the view keeps its last refreshed contents and the error is returned.
+    """
+    try:
+        await db.execute(
+            text("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_historical_game_stats")
+        )
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        logger.warning(
+            f"Could not refresh mv_historical_game_stats, using its last contents: {e}"
+        )
+        return str(e)
+    return None
+
+
+def budget_input_digest(game: Row, input_rows: list) -> str:
+    """Hash everything a game's budget is computed from, independent of row order"""
+    parts = [
+        str(BUDGET_INPUT_DIGEST_VERSION),
+        repr((game.price_per_player, game.max_players)),
+        *sorted(repr(tuple(row)) for row in input_rows),
+    ]
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def compute_budget_for_game(game: Row, input_rows: list) -> dict:
+    """
+    Compute budget metrics for a single game from its budget_input_rows.
+    Payment rows ("p") carry confirmed payments, vote rows ("v") carry
+    "I'm in!" votes on the latest game poll.
+    """
+    actual_income = Decimal(0)
+    number_of_payers = 0
+    paid_player_ids = set()
+    registered_votes = []
+
+    for row in input_rows:
+        if row.kind == "p":
+            actual_income += row.amount
+            number_of_payers += 1
+            paid_player_ids.add(row.player_id)
+        else:
+            registered_votes.append(row)
+
+    registered_count = len(registered_votes)
     unpaid_players = []
     paid_players = []
 
-    if poll:
-        # Get all votes for "I'm in!" option (assuming option_id 0)
-        votes_result = await db.execute(
-            select(PollVote, Player)
-            .outerjoin(Player, PollVote.user_id == Player.telegram_user_id)
-            .where(
-                and_(
-                    PollVote.poll_id == poll.poll_id,
-                    PollVote.option_id == 0,  # "I'm in!" option
-                )
-            )
-        )
-        registered_players = votes_result.all()
-        registered_count = len(registered_players)
-
-        # Separate paid and unpaid
-        paid_player_ids = {payment.player_id for payment, _ in payments_with_players}
-
-        for vote, player in registered_players:
-            if player:
-                player_info = {
-                    "player_id": player.id,
-                    "telegram_user_id": player.telegram_user_id,
-                    "username": player.username,
-                    "display_name": player.display_name,
-                }
-                if player.id in paid_player_ids:
-                    paid_players.append(player_info)
-                else:
-                    unpaid_players.append(player_info)
+    # Separate paid and unpaid
+    for vote in registered_votes:
+        if vote.player_id is not None:
+            player_info = {
+                "player_id": vote.player_id,
+                "telegram_user_id": vote.telegram_user_id,
+                "username": vote.username,
+                "display_name": vote.display_name,
+            }
+            if vote.player_id in paid_player_ids:
+                paid_players.append(player_info)
+            else:
+                unpaid_players.append(player_info)
 
     # Calculate expected income
-    price = float(game.price_per_player) if game.price_per_player else 0
-    if game.max_players:
-        expected_income = price * game.max_players
-    else:
-        expected_income = price * registered_count if registered_count else 0
+    price = game.price_per_player or Decimal(0)
+    expected_income = price * (game.max_players or registered_count)
 
     return {
         "expected_income": expected_income,
@@ -115,52 +131,122 @@ async def compute_budget_for_game(db: AsyncSession, game: GameSchedule) -> dict:
     }
 
 
-async def compute_forecast_for_game(db: AsyncSession, game: GameSchedule) -> dict:
-    """Compute forecast metrics for a single game"""
+async def load_upcoming_games(db: AsyncSession, start: datetime, end: datetime):
+    """Load the columns the analytics need for games scheduled in [start, end]"""
+    result = await db.execute(
+        select(
+            GameSchedule.id,
+            GameSchedule.game_date,
+            GameSchedule.location,
+            GameSchedule.price_per_player,
+            GameSchedule.max_players,
+        )
+        .where(and_(GameSchedule.game_date >= start, GameSchedule.game_date <= end))
+        .order_by(GameSchedule.game_date)
+    )
+    return result.all()
+
+
+async def load_budget_inputs(db: AsyncSession, game_ids: List[int]) -> Dict[int, list]:
+    """
+    Load confirmed payments and "I'm in!" votes for all games in one query.
+    Returns game_id -> rows tagged "p" (payment) or "v" (vote).
+    """
+    # Latest game-type poll per game
+    latest_polls = (
+        select(Poll.poll_id, Poll.game_id)
+        .where(Poll.game_id.in_(game_ids), Poll.poll_type == "game")
+        .distinct(Poll.game_id)
+        .order_by(Poll.game_id, Poll.created_at.desc())
+        .cte("latest_polls")
+    )
+
+    payments = select(
+        literal("p").label("kind"),
+        EventPayment.game_id,
+        EventPayment.player_id,
+        EventPayment.amount,
+        null().label("telegram_user_id"),
+        null().label("username"),
+        null().label("display_name"),
+    ).where(EventPayment.game_id.in_(game_ids), EventPayment.status == "confirmed")
+
+    # Votes for "I'm in!" option (assuming option_id 0)
+    votes = (
+        select(
+            literal("v").label("kind"),
+            latest_polls.c.game_id,
+            Player.id.label("player_id"),
+            null().label("amount"),
+            Player.telegram_user_id,
+            Player.username,
+            Player.display_name,
+        )
+        .select_from(latest_polls)
+        .join(PollVote, PollVote.poll_id == latest_polls.c.poll_id)
+        .outerjoin(Player, Player.telegram_user_id == PollVote.user_id)
+        .where(PollVote.option_id == 0)
+    )
+
+    result = await db.execute(union_all(payments, votes))
+
+    rows_by_game = defaultdict(list)
+    for row in result.all():
+        rows_by_game[row.game_id].append(row)
+    return rows_by_game
 
-    game_weekday = game.game_date.weekday()
 
-    # Get historical games (past completed games, same weekday/location, last 90 days)
-    historical_cutoff = datetime.utcnow() - timedelta(days=90)
+async def load_historical_stats(db: AsyncSession, now: datetime) -> HistoricalStats:
+    """
+    Load per (weekday, location) averages of past games in the 90 days before now.
+    Reads the per-game rows of mv_historical_game_stats, refreshed at job start.
+    """
+    historical_cutoff = now - timedelta(days=90)
 
-    # Get historical payment data
-    historical_result = await db.execute(
+    result = await db.execute(
         select(
-            GameSchedule.id,
-            func.count(EventPayment.id).label("payment_count"),
-            func.sum(EventPayment.amount).label("total_revenue"),
-        )
-        .outerjoin(
-            EventPayment,
-            and_(
-                EventPayment.game_id == GameSchedule.id,
-                EventPayment.status == "confirmed",
-            ),
+            historical_game_stats.c.weekday,
+            historical_game_stats.c.location,
+            func.avg(historical_game_stats.c.payment_count).label("avg_players"),
+            func.avg(historical_game_stats.c.total_revenue).label("avg_revenue"),
+            func.count().label("games_count"),
         )
         .where(
             and_(
-                GameSchedule.game_date < datetime.utcnow(),
-                GameSchedule.game_date > historical_cutoff,
-                func.extract("dow", GameSchedule.game_date) == game_weekday,
-                GameSchedule.location == game.location,
+                historical_game_stats.c.game_date < now,
+                historical_game_stats.c.game_date > historical_cutoff,
             )
         )
-        .group_by(GameSchedule.id)
+        .group_by(historical_game_stats.c.weekday, historical_game_stats.c.location)
     )
-    historical_games = historical_result.all()
 
-    if historical_games:
-        # Calculate averages
-        avg_players = sum(g.payment_count for g in historical_games) / len(
-            historical_games
-        )
-        avg_revenue = sum(float(g.total_revenue or 0) for g in historical_games) / len(
-            historical_games
+    return {
+        (row.weekday, row.location): (
+            float(row.avg_players),
+            row.avg_revenue,
+            row.games_count,
         )
+        for row in result.all()
+    }
+
+
+def compute_forecast_for_game(game: Row, historical_stats: HistoricalStats) -> dict:
+    """Compute forecast metrics for a single game"""
+
+    game_weekday = game.game_date.weekday()
+    # Postgres dow counts from Sunday = 0, Python weekday() from Monday = 0
+    game_dow = game.game_date.isoweekday() % 7
+
+    # Past games on the same weekday at the same location
+    stats = historical_stats.get((game_dow, game.location))
+    historical_games_count = stats[2] if stats else 0
+
+    if stats:
+        avg_players, avg_revenue, _ = stats
         confidence = (
             "high"
-            if len(historical_games) >= 5
-            else "medium" if len(historical_games) >= 2 else "low"
+            if historical_games_count >= 5
+            else "medium" if historical_games_count >= 2 else "low"
         )
 
         forecasted_players = int(round(avg_players))
@@ -168,7 +254,7 @@ async def compute_forecast_for_game(db: AsyncSession, game: GameSchedule) -> dic
     else:
         # No historical data, use game settings
         forecasted_players = game.max_players or 16
-        forecasted_income = float(game.price_per_player or 0) * forecasted_players
+        forecasted_income = (game.price_per_player or Decimal(0)) * forecasted_players
         confidence = "low"
 
     return {
@@ -177,162 +263,159 @@ async def compute_forecast_for_game(db: AsyncSession, game: GameSchedule) -> dic
         "confidence_level": confidence,
         "method": "historical_average",
         "metadata": {
-            "historical_games_count": len(historical_games),
+            "historical_games_count": historical_games_count,
             "weekday": game_weekday,
             "location": game.location,
         },
     }
 
 
-async def run_budget_analytics_job(job_name: str = "budget_analytics"):
-    """Main budget analytics job execution"""
-    config = JobConfig()
+async def upsert_cache_rows(
+    db: AsyncSession, model, rows: list, skip_unchanged: bool = False
+) -> int:
+    """
+    Insert or replace per-game cache rows with one INSERT ... ON CONFLICT.
+    With skip_unchanged, rows whose input_digest matches are left untouched.
+    Returns the number of rows written.
+    """
+    if not rows:
+        return 0
+    stmt = pg_insert(model).values(rows)
+    where = None
+    if skip_unchanged:
+        where = model.input_digest.is_distinct_from(stmt.excluded.input_digest)
+    result = await db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["game_id"],
+            set_={
+                column.name: column
+                for column in stmt.excluded
+                if column.name not in ("id", "game_id")
+            },
+            where=where,
+        )
+    )
+    return result.rowcount
 
-    # Use sync session for job recording
-    sync_session = get_db_session(config)
 
+async def run_budget_analytics_job(job_name: str = "budget_analytics"):
+    """Main budget analytics job execution"""
     try:
-        # Create async session for main work
+        # One async session serves both the analytics work and job recording
         async with AsyncSessionLocal() as db:
             logger.info("Starting budget analytics job...")
 
-            # Find upcoming games (next 7 days)
-            today = datetime.utcnow()
-            next_week = today + timedelta(days=7)
-
-            games_result = await db.execute(
-                select(GameSchedule)
-                .where(
-                    and_(
-                        GameSchedule.game_date >= today,
-                        GameSchedule.game_date <= next_week,
-                    )
-                )
-                .order_by(GameSchedule.game_date)
+            # Keep historical stats fresh for the forecast endpoint; a failed
+            # refresh is reported but does not stop the run
+            refresh_error = await refresh_historical_game_stats(db)
+            warnings = (
+                {"warning": f"historical stats refresh failed: {refresh_error}"}
+                if refresh_error
+                else {}
             )
-            games = games_result.scalars().all()
+
+            # Find upcoming games (next 7 days); one timestamp serves the whole run
+            now = datetime.utcnow()
+            next_week = now + timedelta(days=7)
+
+            # Upcoming games and historical averages are independent reads, so
+            # they run concurrently on separate connections
+            async with AsyncSessionLocal() as stats_db:
+                games, historical_stats = await asyncio.gather(
+                    load_upcoming_games(db, now, next_week),
+                    load_historical_stats(stats_db, now),
+                )
 
             if not games:
                 logger.info("No upcoming games found in the next 7 days")
-                record_job_run(
-                    sync_session,
+                await arecord_job_run(
+                    db,
                     job_name=job_name,
                     status="success",
-                    payload={"games_processed": 0},
+                    payload={"games_processed": 0, **warnings},
                 )
                 return
 
             logger.info(f"Found {len(games)} upcoming games to process")
 
-            games_processed = 0
+            budget_inputs = await load_budget_inputs(db, [game.id for game in games])
+
+            # Cache rows for all games, written with one upsert per table
+            budget_rows = []
+            forecast_rows = []
 
             for game in games:
                 logger.info(f"Processing game {game.id} on {game.game_date}")
 
                 # Compute budget metrics
-                budget_data = await compute_budget_for_game(db, game)
-
-                # Update or create budget cache
-                budget_cache_result = await db.execute(
-                    select(BudgetCache).where(BudgetCache.game_id == game.id)
+                input_rows = budget_inputs[game.id]
+                budget_data = compute_budget_for_game(game, input_rows)
+                budget_rows.append(
+                    {
+                        "game_id": game.id,
+                        "input_digest": budget_input_digest(game, input_rows),
+                        "expected_income": budget_data["expected_income"],
+                        "actual_income": budget_data["actual_income"],
+                        "number_of_payers": budget_data["number_of_payers"],
+                        "expected_players": budget_data["expected_players"],
+                        "registered_players": budget_data["registered_players"],
+                        "paid_players_list": budget_data["paid_players_list"],
+                        "unpaid_players_list": budget_data["unpaid_players_list"],
+                        "computed_at": now,
+                    }
                 )
-                budget_cache = budget_cache_result.scalar_one_or_none()
-
-                if budget_cache:
-                    # Update existing
-                    budget_cache.expected_income = Decimal(
-                        str(budget_data["expected_income"])
-                    )
-                    budget_cache.actual_income = Decimal(
-                        str(budget_data["actual_income"])
-                    )
-                    budget_cache.number_of_payers = budget_data["number_of_payers"]
-                    budget_cache.expected_players = budget_data["expected_players"]
-                    budget_cache.registered_players = budget_data["registered_players"]
-                    budget_cache.paid_players_list = budget_data["paid_players_list"]
-                    budget_cache.unpaid_players_list = budget_data[
-                        "unpaid_players_list"
-                    ]
-                    budget_cache.computed_at = datetime.utcnow()
-                else:
-                    # Create new
-                    budget_cache = BudgetCache(
-                        game_id=game.id,
-                        expected_income=Decimal(str(budget_data["expected_income"])),
-                        actual_income=Decimal(str(budget_data["actual_income"])),
-                        number_of_payers=budget_data["number_of_payers"],
-                        expected_players=budget_data["expected_players"],
-                        registered_players=budget_data["registered_players"],
-                        paid_players_list=budget_data["paid_players_list"],
-                        unpaid_players_list=budget_data["unpaid_players_list"],
-                    )
-                    db.add(budget_cache)
 
                 # Compute forecast metrics
-                forecast_data = await compute_forecast_for_game(db, game)
-
-                # Update or create forecast cache
-                forecast_cache_result = await db.execute(
-                    select(ForecastCache).where(ForecastCache.game_id == game.id)
+                forecast_data = compute_forecast_for_game(game, historical_stats)
+                forecast_rows.append(
+                    {
+                        "game_id": game.id,
+                        "forecasted_players": forecast_data["forecasted_players"],
+                        "forecasted_income": forecast_data["forecasted_income"],
+                        "confidence_level": forecast_data["confidence_level"],
+                        "method": forecast_data["method"],
+                        "forecast_metadata": forecast_data["metadata"],
+                        "computed_at": now,
+                    }
                 )
-                forecast_cache = forecast_cache_result.scalar_one_or_none()
-
-                if forecast_cache:
-                    # Update existing
-                    forecast_cache.forecasted_players = forecast_data[
-                        "forecasted_players"
-                    ]
-                    forecast_cache.forecasted_income = Decimal(
-                        str(forecast_data["forecasted_income"])
-                    )
-                    forecast_cache.confidence_level = forecast_data["confidence_level"]
-                    forecast_cache.method = forecast_data["method"]
-                    forecast_cache.metadata = forecast_data["metadata"]
-                    forecast_cache.computed_at = datetime.utcnow()
-                else:
-                    # Create new
-                    forecast_cache = ForecastCache(
-                        game_id=game.id,
-                        forecasted_players=forecast_data["forecasted_players"],
-                        forecasted_income=Decimal(
-                            str(forecast_data["forecasted_income"])
-                        ),
-                        confidence_level=forecast_data["confidence_level"],
-                        method=forecast_data["method"],
-                        metadata=forecast_data["metadata"],
-                    )
-                    db.add(forecast_cache)
-
-                games_processed += 1
+
+            # Budgets whose inputs have not changed since the last run are not rewritten
+            budgets_updated = await upsert_cache_rows(
+                db, BudgetCache, budget_rows, skip_unchanged=True
+            )
+            await upsert_cache_rows(db, ForecastCache, forecast_rows)
+            games_processed = len(games)
 
             # Commit all changes
             await db.commit()
 
             logger.info(
-                f"Budget analytics completed. Processed {games_processed} games."
+                f"Budget analytics completed. Processed {games_processed} games, "
+                f"{budgets_updated} budget(s) changed."
             )
 
             # Record successful job run
-            record_job_run(
-                sync_session,
+            await arecord_job_run(
+                db,
                 job_name=job_name,
                 status="success",
-                payload={"games_processed": games_processed},
+                payload={
+                    "games_processed": games_processed,
+                    "budgets_updated": budgets_updated,
+                    **warnings,
+                },
             )
 
     except Exception as e:
         logger.error(f"Budget analytics job failed: {e}", exc_info=True)
 
-        record_job_run(
-            sync_session, job_name=job_name, status="failed", error_message=str(e)
-        )
+        async with AsyncSessionLocal() as db:
+            await arecord_job_run(
+                db, job_name=job_name, status="failed", error_message=str(e)
+            )
 
         sys.exit(1)
 
-    finally:
-        if sync_session:
-            sync_session.close()
-
 
 def main():
     """Entry point"""
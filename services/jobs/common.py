@@ -1,11 +1,16 @@
 """Common utilities for job scripts"""
 
+import asyncio
 import os
 import sys
+import time
 import logging
 from datetime import datetime
-from typing import Optional
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional
 from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import sessionmaker
 from google.cloud import secretmanager
 from aiogram import Bot
@@ -16,6 +21,59 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Decoded secrets are cached on local disk so frequent cron runs skip Secret Manager
+SECRET_CACHE_DIR = Path(os.getenv("SECRET_CACHE_DIR", "/tmp/.secret_cache"))
+SECRET_CACHE_TTL_SECONDS = 3600
+
+# Secret Manager id -> environment variable that overrides it
+SECRET_ENV_FALLBACKS = {
+    "db-password": "DB_PASSWORD",
+    "telegram-bot-token": "TELEGRAM_BOT_TOKEN",
+}
+
+
+def read_cached_secret(secret_id: str) -> Optional[str]:
+    """Return a locally cached secret if it is fresh enough"""
+    path = SECRET_CACHE_DIR / secret_id
+    try:
+        if time.time() - path.stat().st_mtime < SECRET_CACHE_TTL_SECONDS:
+            return path.read_text()
+    except OSError:
+        pass
+    return None
+
+
+def write_cached_secret(secret_id: str, value: str):
+    """Cache a secret on local disk, readable by the owner only"""
+    path = SECRET_CACHE_DIR / secret_id
+    try:
+        SECRET_CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.fchmod(fd, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(value)
+    except OSError as e:
+        logger.warning(f"Could not cache {secret_id}: {e}")
+
+
+@lru_cache(maxsize=None)
+def get_secret(project_id: str, secret_id: str) -> str:
+    """Resolve a secret from env, the disk cache, or Secret Manager (in that order)"""
+    env_value = os.getenv(SECRET_ENV_FALLBACKS.get(secret_id, ""))
+    if env_value:
+        return env_value
+
+    value = read_cached_secret(secret_id)
+    if value is not None:
+        return value
+
+    client = secretmanager.SecretManagerServiceClient()
+    name = f"projects/{project_id}/secrets/{secret_id}/versions/latest"
+    response = client.access_secret_version(request={"name": name})
+    value = response.payload.data.decode("UTF-8")
+    write_cached_secret(secret_id, value)
+    return value
+
 
 class JobConfig:
     """Configuration for job scripts"""
@@ -39,32 +97,24 @@ class JobConfig:
         self.load_secrets()
 
     def load_secrets(self):
-        """Load secrets from GCP Secret Manager"""
+        """Load secrets from env, the local cache, or GCP Secret Manager"""
         if not self.project_id:
             logger.warning("GCP_PROJECT_ID not set, skipping Secret Manager")
+            self.db_password = os.getenv("DB_PASSWORD")
+            self.telegram_bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
             return
 
+        # Load database password
         try:
-            client = secretmanager.SecretManagerServiceClient()
-
-            # Load database password
-            try:
-                name = f"projects/{self.project_id}/secrets/db-password/versions/latest"
-                response = client.access_secret_version(request={"name": name})
-                self.db_password = response.payload.data.decode("UTF-8")
-            except Exception as e:
-                logger.error(f"Could not load db-password: {e}")
-
-            # Load Telegram bot token
-            try:
-                name = f"projects/{self.project_id}/secrets/telegram-bot-token/versions/latest"
-                response = client.access_secret_version(request={"name": name})
-                self.telegram_bot_token = response.payload.data.decode("UTF-8")
-            except Exception as e:
-                logger.error(f"Could not load telegram-bot-token: {e}")
+            self.db_password = get_secret(self.project_id, "db-password")
+        except Exception as e:
+            logger.error(f"Could not load db-password: {e}")
 
+        # Load Telegram bot token
+        try:
+            self.telegram_bot_token = get_secret(self.project_id, "telegram-bot-token")
         except Exception as e:
-            logger.error(f"Error loading secrets: {e}")
+            logger.error(f"Could not load telegram-bot-token: {e}")
 
     @property
     def database_url(self) -> str:
@@ -72,51 +122,147 @@ class JobConfig:
         return f"postgresql://{self.db_user}:{self.db_password}@{self.db_host}:{self.db_port}/{self.db_name}"
 
 
+@lru_cache(maxsize=1)
+def _engine(database_url: str):
+    """One pooled engine per process, shared by every session a job opens"""
+    return create_engine(database_url, echo=False, pool_pre_ping=True, pool_size=5)
+
+
 def get_db_session(config: JobConfig):
     """Create database session"""
-    engine = create_engine(config.database_url, echo=False)
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=_engine(config.database_url))
     return Session()
 
 
+def _job_models():
+    """Import job bookkeeping models lazily to avoid a circular dependency"""
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../bot-api"))
+    from db.models import JobDefinition, JobRun
+
+    return JobDefinition, JobRun
+
+
+# Job definition name -> id, looked up once per process
+_job_def_id_cache: Dict[str, int] = {}
+
+
+def _new_job_run(job_id: int, status: str, error_message, payload):
+    """Build a JobRun row for a finished or running job"""
+    _, JobRun = _job_models()
+    now = datetime.utcnow()
+    return JobRun(
+        job_id=job_id,
+        scheduled_time=now,
+        started_at=now,
+        finished_at=now if status in ["success", "failed"] else None,
+        status=status,
+        error_message=error_message,
+        payload=payload,
+    )
+
+
 def record_job_run(
     session,
     job_name: str,
     status: str,
     error_message: Optional[str] = None,
     payload: Optional[dict] = None,
+    commit: bool = True,
 ):
-    """Record job run in database"""
-    from datetime import datetime
+    """Record job run in database
 
-    # Import here to avoid circular dependency
-    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../bot-api"))
-    from db.models import JobDefinition, JobRun
+    Pass commit=False to only add the row and let the caller commit it
+    together with its own writes.
+    """
+    JobDefinition, _ = _job_models()
 
     # Find job definition
-    job = session.query(JobDefinition).filter_by(name=job_name).first()
+    job_id = _job_def_id_cache.get(job_name)
+    if job_id is None:
+        job_id = session.query(JobDefinition.id).filter_by(name=job_name).scalar()
 
-    if not job:
+    if job_id is None:
         logger.warning(f"Job definition not found for: {job_name}")
         return
+    _job_def_id_cache[job_name] = job_id
 
-    # Create job run record
-    job_run = JobRun(
-        job_id=job.id,
-        scheduled_time=datetime.utcnow(),
-        started_at=datetime.utcnow(),
-        finished_at=datetime.utcnow() if status in ["success", "failed"] else None,
-        status=status,
-        error_message=error_message,
-        payload=payload,
-    )
+    session.add(_new_job_run(job_id, status, error_message, payload))
+    if commit:
+        session.commit()
+
+    logger.info(f"Job run recorded: {job_name} - {status}")
+
+
+async def aget_job_definition_id(session: AsyncSession, job_name: str) -> Optional[int]:
+    """Look up a job definition id, cached per process"""
+    JobDefinition, _ = _job_models()
+
+    job_id = _job_def_id_cache.get(job_name)
+    if job_id is None:
+        job_id = await session.scalar(select(JobDefinition.id).filter_by(name=job_name))
+        if job_id is not None:
+            _job_def_id_cache[job_name] = job_id
+    return job_id
+
+
+async def arecord_job_run(
+    session: AsyncSession,
+    job_name: str,
+    status: str,
+    error_message: Optional[str] = None,
+    payload: Optional[dict] = None,
+    commit: bool = True,
+):
+    """Record job run in database using an async session
 
-    session.add(job_run)
-    session.commit()
+    Pass commit=False to only add the row and let the caller commit it
+    together with its own writes.
+    """
+    # Find job definition
+    job_id = await aget_job_definition_id(session, job_name)
+    if job_id is None:
+        logger.warning(f"Job definition not found for: {job_name}")
+        return
+
+    session.add(_new_job_run(job_id, status, error_message, payload))
+    if commit:
+        await session.commit()
 
     logger.info(f"Job run recorded: {job_name} - {status}")
 
 
+# Bot per token, shared for the life of the process so Telegram sends reuse
+# one aiohttp connection pool
+_bots: Dict[str, Bot] = {}
+
+
+def get_bot(token: str) -> Bot:
+    """Shared Bot for a token; created on first use"""
+    bot = _bots.get(token)
+    if bot is None:
+        bot = _bots[token] = Bot(token=token)
+    return bot
+
+
+async def close_bots():
+    """Close the HTTP sessions of all shared bots"""
+    while _bots:
+        _, bot = _bots.popitem()
+        await bot.session.close()
+
+
+def run_job(job):
+    """Run a job coroutine, closing shared clients before the event loop ends"""
+
+    async def _run():
+        try:
+            return await job
+        finally:
+            await close_bots()
+
+    return asyncio.run(_run())
+
+
 async def send_telegram_poll(
     bot: Bot, chat_id: str, question: str, options: list, is_anonymous: bool = False
 ) -> str:
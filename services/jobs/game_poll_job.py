@@ -8,7 +8,6 @@ This job:
 3. Posts the poll to Telegram
 4. Records the poll in the database
 """
-import asyncio
 import logging
 import sys
 import os
@@ -17,11 +16,11 @@ from datetime import datetime, timedelta
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../bot-api"))
 
-from aiogram import Bot
 from sqlalchemy import select
 
 from db.models import Poll, GameSchedule
-from common import JobConfig, get_db_session, record_job_run, send_telegram_poll
+from db.database import AsyncSessionLocal
+from common import JobConfig, arecord_job_run, get_bot, run_job, send_telegram_poll
 
 logger = logging.getLogger(__name__)
 
@@ -39,29 +38,25 @@ async def run_game_poll_job(job_name: str = "game_poll_tuesday"):
         logger.error("Telegram chat ID not configured")
         sys.exit(1)
 
-    db_session = None
-    bot = None
-
     try:
-        # Initialize database session
-        db_session = get_db_session(config)
-
         # Initialize Telegram bot
-        bot = Bot(token=config.telegram_bot_token)
+        bot = get_bot(config.telegram_bot_token)
 
         # Find the next scheduled game (within next 7 days)
         logger.info("Finding next scheduled game...")
         next_week = datetime.utcnow() + timedelta(days=7)
 
-        game = (
-            db_session.query(GameSchedule)
-            .filter(
-                GameSchedule.game_date > datetime.utcnow(),
-                GameSchedule.game_date <= next_week,
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(GameSchedule)
+                .where(
+                    GameSchedule.game_date > datetime.utcnow(),
+                    GameSchedule.game_date <= next_week,
+                )
+                .order_by(GameSchedule.game_date)
+                .limit(1)
             )
-            .order_by(GameSchedule.game_date)
-            .first()
-        )
+            game = result.scalars().first()
 
         if not game:
             logger.warning("No upcoming games found in the next 7 days")
@@ -114,40 +109,34 @@ async def run_game_poll_job(job_name: str = "game_poll_tuesday"):
             game_id=game_id,
             created_at=datetime.utcnow(),
         )
-        db_session.add(poll)
-        db_session.commit()
-
-        # Record successful job run
-        record_job_run(
-            db_session,
-            job_name=job_name,
-            status="success",
-            payload={
-                "poll_id": poll_id,
-                "game_id": game_id,
-                "game_date": game_date_str if game else None,
-            },
-        )
+        async with AsyncSessionLocal() as db:
+            db.add(poll)
+            await db.commit()
+
+            # Record successful job run
+            await arecord_job_run(
+                db,
+                job_name=job_name,
+                status="success",
+                payload={
+                    "poll_id": poll_id,
+                    "game_id": game_id,
+                    "game_date": game_date_str if game else None,
+                },
+            )
 
         logger.info(f"Game poll job completed successfully. Poll ID: {poll_id}")
 
     except Exception as e:
         logger.error(f"Game poll job failed: {e}", exc_info=True)
 
-        if db_session:
-            record_job_run(
-                db_session, job_name=job_name, status="failed", error_message=str(e)
+        async with AsyncSessionLocal() as db:
+            await arecord_job_run(
+                db, job_name=job_name, status="failed", error_message=str(e)
             )
 
         sys.exit(1)
 
-    finally:
-        if db_session:
-            db_session.close()
-
-        if bot:
-            await bot.session.close()
-
 
 def main():
     """Entry point"""
@@ -157,7 +146,7 @@ def main():
     )
 
     logger.info(f"Starting game poll job: {job_name}")
-    asyncio.run(run_game_poll_job(job_name))
+    run_job(run_game_poll_job(job_name))
 
 
 if __name__ == "__main__":
@@ -17,14 +17,43 @@ from datetime import datetime, timedelta
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../bot-api"))
 
-from aiogram import Bot
-from sqlalchemy import select
+from sqlalchemy import select, update
 
 from db.models import GameSchedule
-from common import JobConfig, get_db_session, record_job_run, send_telegram_message
+from db.database import AsyncSessionLocal
+from common import (
+    JobConfig,
+    arecord_job_run,
+    get_bot,
+    run_job,
+    send_telegram_message,
+)
 
 logger = logging.getLogger(__name__)
 
+# Concurrent Telegram sends, kept low to stay under the bot API rate limits
+TELEGRAM_SEND_CONCURRENCY = 5
+
+# Same as bot-api's bot/payment_commands.py; the jobs image only ships bot-api's db/
+GAME_DATE_FMT = "%A, %B %d at %I:%M %p"
+
+NOTIFICATION_TEMPLATE = (
+    "🏐 Upcoming Game Reminder!\n\n"
+    "📅 When: {when}\n"
+    "📍 Where: {where}\n"
+    "{description}"
+    "\nSee you there! 🎉"
+)
+
+
+def build_notification_message(game: GameSchedule) -> str:
+    """Render the reminder text for a single game"""
+    return NOTIFICATION_TEMPLATE.format(
+        when=game.game_date.strftime(GAME_DATE_FMT),
+        where=game.location,
+        description=f"\n{game.description}\n" if game.description else "",
+    )
+
 
 async def run_notification_job(job_name: str = "notification_monday"):
     """Main notification job execution"""
@@ -39,84 +68,91 @@ async def run_notification_job(job_name: str = "notification_monday"):
         logger.error("Telegram chat ID not configured")
         sys.exit(1)
 
-    db_session = None
-    bot = None
-
     try:
-        # Initialize database session
-        db_session = get_db_session(config)
-
         # Initialize Telegram bot
-        bot = Bot(token=config.telegram_bot_token)
-
-        # Find games that need notification (next 7 days, not yet notified)
-        logger.info("Finding games that need notification...")
-        next_week = datetime.utcnow() + timedelta(days=7)
-
-        games = (
-            db_session.query(GameSchedule)
-            .filter(
-                GameSchedule.game_date > datetime.utcnow(),
-                GameSchedule.game_date <= next_week,
-                GameSchedule.notified == False,
+        bot = get_bot(config.telegram_bot_token)
+
+        async with AsyncSessionLocal() as db:
+            # Find games that need notification (next 7 days, not yet notified)
+            logger.info("Finding games that need notification...")
+            now = datetime.utcnow()
+            next_week = now + timedelta(days=7)
+
+            result = await db.execute(
+                select(GameSchedule)
+                .where(
+                    GameSchedule.game_date > now,
+                    GameSchedule.game_date <= next_week,
+                    GameSchedule.notified == False,
+                )
+                .order_by(GameSchedule.game_date)
             )
-            .order_by(GameSchedule.game_date)
-            .all()
-        )
-
-        if not games:
-            logger.info("No games need notification at this time")
-            record_job_run(
-                db_session,
-                job_name=job_name,
-                status="success",
-                payload={"games_notified": 0},
+            games = result.scalars().all()
+
+            if not games:
+                logger.info("No games need notification at this time")
+                await arecord_job_run(
+                    db,
+                    job_name=job_name,
+                    status="success",
+                    payload={"games_notified": 0},
+                )
+                return
+
+            logger.info(f"Found {len(games)} game(s) to notify")
+
+            # Send notifications concurrently, bounded to respect rate limits
+            semaphore = asyncio.Semaphore(TELEGRAM_SEND_CONCURRENCY)
+
+            async def notify(game: GameSchedule):
+                async with semaphore:
+                    logger.info(f"Sending notification for game {game.id}")
+                    await send_telegram_message(
+                        bot=bot,
+                        chat_id=config.telegram_chat_id,
+                        text=build_notification_message(game),
+                    )
+
+            # A failed send leaves its game unnotified so the next run retries it
+            results = await asyncio.gather(
+                *(notify(game) for game in games), return_exceptions=True
             )
-            return
-
-        logger.info(f"Found {len(games)} game(s) to notify")
-
-        # Send notifications for each game
-        notified_count = 0
-        for game in games:
-            game_date_str = game.game_date.strftime("%A, %B %d at %I:%M %p")
-
-            # Create notification message
-            message = (
-                f"🏐 Upcoming Game Reminder!\n\n"
-                f"📅 When: {game_date_str}\n"
-                f"📍 Where: {game.location}\n"
+            notified_games = []
+            failed_game_ids = []
+            for game, result in zip(games, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Notification for game {game.id} failed: {result}")
+                    failed_game_ids.append(game.id)
+                else:
+                    notified_games.append(game)
+
+            if not notified_games:
+                raise RuntimeError(f"All {len(games)} notification(s) failed")
+
+            # Mark games as notified with a single UPDATE
+            notified_ids = [game.id for game in notified_games]
+            await db.execute(
+                update(GameSchedule)
+                .where(GameSchedule.id.in_(notified_ids))
+                .values(notified=True)
             )
+            notified_count = len(notified_ids)
 
-            if game.description:
-                message += f"\n{game.description}\n"
-
-            message += f"\nSee you there! 🎉"
+            # Commit all updates
+            await db.commit()
 
-            # Send notification
-            logger.info(f"Sending notification for game on {game_date_str}")
-            await send_telegram_message(
-                bot=bot, chat_id=config.telegram_chat_id, text=message
+            # Record successful job run
+            await arecord_job_run(
+                db,
+                job_name=job_name,
+                status="success",
+                payload={
+                    "games_notified": notified_count,
+                    "game_ids": notified_ids,
+                    "failed_game_ids": failed_game_ids,
+                },
             )
 
-            # Mark game as notified
-            game.notified = True
-            notified_count += 1
-
-        # Commit all updates
-        db_session.commit()
-
-        # Record successful job run
-        record_job_run(
-            db_session,
-            job_name=job_name,
-            status="success",
-            payload={
-                "games_notified": notified_count,
-                "game_ids": [g.id for g in games],
-            },
-        )
-
         logger.info(
             f"Notification job completed successfully. Notified {notified_count} game(s)"
         )
@@ -124,21 +160,13 @@ async def run_notification_job(job_name: str = "notification_monday"):
     except Exception as e:
         logger.error(f"Notification job failed: {e}", exc_info=True)
 
-        if db_session:
-            db_session.rollback()
-            record_job_run(
-                db_session, job_name=job_name, status="failed", error_message=str(e)
+        async with AsyncSessionLocal() as db:
+            await arecord_job_run(
+                db, job_name=job_name, status="failed", error_message=str(e)
             )
 
         sys.exit(1)
 
-    finally:
-        if db_session:
-            db_session.close()
-
-        if bot:
-            await bot.session.close()
-
 
 def main():
     """Entry point"""
@@ -150,7 +178,7 @@ def main():
     )
 
     logger.info(f"Starting notification job: {job_name}")
-    asyncio.run(run_notification_job(job_name))
+    run_job(run_notification_job(job_name))
 
 
 if __name__ == "__main__":
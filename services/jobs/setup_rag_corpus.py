@@ -13,9 +13,8 @@ Run this manually or as part of deployment:
 import os
 import sys
 import logging
-from typing import Optional
+from typing import Dict, Optional
 
-from google.cloud import aiplatform
 from vertexai.preview import rag
 import vertexai
 
@@ -25,6 +24,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Chunking used when importing the rules PDF (in tokens); override to
+# experiment, then re-import the file
+RAG_CHUNK_SIZE = int(os.getenv("RAG_CHUNK_SIZE", "512"))
+RAG_CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "64"))
+
 
 class RAGCorpusSetup:
     """Setup and manage Vertex AI RAG corpus"""
@@ -38,6 +42,8 @@ class RAGCorpusSetup:
         self.project_id = project_id
         self.location = location
         self.corpus_display_name = corpus_display_name
+        # display_name -> RagCorpus, filled by the first list_corpora call
+        self._corpus_by_name: Optional[Dict[str, rag.RagCorpus]] = None
 
         # Initialize Vertex AI
         vertexai.init(project=project_id, location=location)
@@ -68,6 +74,8 @@ class RAGCorpusSetup:
             )
 
             logger.info(f"Successfully created corpus: {corpus.name}")
+            if self._corpus_by_name is not None:
+                self._corpus_by_name[corpus.display_name] = corpus
             return corpus.name
 
         except Exception as e:
@@ -78,21 +86,26 @@ class RAGCorpusSetup:
         """
         Find corpus by display name.
 
+        Corpora are listed once per instance and memoized by display name.
+
         Args:
             display_name: Display name of the corpus
 
         Returns:
             RagCorpus object or None
         """
+        if self._corpus_by_name is not None:
+            return self._corpus_by_name.get(display_name)
+
         try:
             # List all corpora
             corpora = rag.list_corpora()
-
+            corpus_by_name: Dict[str, rag.RagCorpus] = {}
             for corpus in corpora:
-                if corpus.display_name == display_name:
-                    return corpus
-
-            return None
+                # Keep the first match, as the old linear scan did
+                corpus_by_name.setdefault(corpus.display_name, corpus)
+            self._corpus_by_name = corpus_by_name
+            return self._corpus_by_name.get(display_name)
 
         except Exception as e:
             logger.warning(f"Error listing corpora: {e}")
@@ -102,8 +115,8 @@ class RAGCorpusSetup:
         self,
         corpus_name: str,
         gcs_uri: str,
-        chunk_size: int = 1024,
-        chunk_overlap: int = 200,
+        chunk_size: int = RAG_CHUNK_SIZE,
+        chunk_overlap: int = RAG_CHUNK_OVERLAP,
     ) -> str:
         """
         Import a file from Cloud Storage into the RAG corpus.
@@ -131,11 +144,11 @@ class RAGCorpusSetup:
 
             logger.info(f"Import operation completed: {response}")
 
-            # Get the imported file
-            files = list(rag.list_files(corpus_name=corpus_name))
-            if files:
-                logger.info(f"Successfully imported file: {files[0].name}")
-                return files[0].name
+            # Get the imported file (stop the paginator after the first item)
+            first_file = next(iter(rag.list_files(corpus_name=corpus_name)), None)
+            if first_file is not None:
+                logger.info(f"Successfully imported file: {first_file.name}")
+                return first_file.name
             else:
                 raise Exception("File import completed but no files found in corpus")
 
@@ -161,7 +174,8 @@ class RAGCorpusSetup:
                 "name": corpus.name,
                 "display_name": corpus.display_name,
                 "description": corpus.description,
-                "file_count": len(list(files)),
+                # Count while paging instead of holding every RagFile in memory
+                "file_count": sum(1 for _ in files),
             }
 
             logger.info(f"Corpus info: {info}")
@@ -214,8 +228,8 @@ def main():
         file_name = setup.import_file(
             corpus_name=corpus_name,
             gcs_uri=gcs_uri,
-            chunk_size=1024,  # ~1024 tokens per chunk
-            chunk_overlap=200,  # 200 token overlap for context
+            chunk_size=RAG_CHUNK_SIZE,  # 512 tokens per chunk by default
+            chunk_overlap=RAG_CHUNK_OVERLAP,  # ~12% overlap for context
         )
         logger.info(f"File imported: {file_name}")
 
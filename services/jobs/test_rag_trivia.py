@@ -3,6 +3,7 @@
 Test script to verify RAG-based trivia generation works locally.
 This script tests the TriviaGenerator without requiring database or Telegram.
 """
+import asyncio
 import os
 import sys
 import logging
@@ -59,10 +60,10 @@ def main():
 
     # Test 2: Generate trivia question
     logger.info("\n--- Test 2: Generate Trivia Question ---")
-    questions = generator.generate_trivia_questions(
+    questions = asyncio.run(generator.generate_trivia_questions(
         topic="volleyball court dimensions and net height",
         count=1
-    )
+    ))
 
     if questions:
         logger.info(f"✓ Successfully generated {len(questions)} question(s)")
@@ -10,25 +10,210 @@ This job:
 """
 import asyncio
 import logging
+import math
 import sys
 import os
+import re
+import time
 from datetime import datetime
-from typing import List, Dict
+from functools import lru_cache
+from typing import List, Dict, Optional
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../bot-api"))
 
-from google.cloud import aiplatform
+import orjson
 import vertexai
-from vertexai.generative_models import GenerativeModel
+from vertexai.generative_models import GenerationConfig, GenerativeModel
 from vertexai.preview import rag
-from aiogram import Bot
-
-from db.models import Poll
-from common import JobConfig, get_db_session, record_job_run, send_telegram_poll
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import Poll, TriviaQuestion
+from db.database import AsyncSessionLocal
+from common import (
+    JobConfig,
+    aget_job_definition_id,
+    arecord_job_run,
+    get_bot,
+    run_job,
+    send_telegram_poll,
+)
 
 logger = logging.getLogger(__name__)
 
+# Retrieved rules context is reused within this window, then fetched again
+# so corpus updates are picked up
+RAG_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("RAG_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+
+# Chunks fetched from the corpus, and how many of them are kept in the prompt
+# after re-ranking them against the query
+RAG_RETRIEVAL_TOP_K = int(os.getenv("RAG_RETRIEVAL_TOP_K", "10"))
+RAG_CONTEXT_CHUNKS = int(os.getenv("RAG_CONTEXT_CHUNKS", "3"))
+WORD_RE = re.compile(r"\w+")
+# Query words that match nearly every chunk of the rules PDF
+RERANK_STOPWORDS = frozenset({"a", "about", "of", "the", "rule", "rules", "volleyball"})
+
+# Questions generated per Gemini call; the spares are posted by later runs
+TRIVIA_TOPIC = "volleyball"
+TRIVIA_BATCH_SIZE = int(os.getenv("TRIVIA_BATCH_SIZE", "7"))
+
+# Structured output: Gemini enforces this schema server-side, so the answer is
+# a bare JSON array with no code fence or surrounding prose to strip
+TRIVIA_RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "question": {"type": "STRING"},
+            "options": {
+                "type": "ARRAY",
+                "items": {"type": "STRING"},
+                "min_items": 4,
+                "max_items": 4,
+            },
+            "correct_answer": {"type": "INTEGER"},
+        },
+        "required": ["question", "options", "correct_answer"],
+    },
+}
+TRIVIA_GENERATION_CONFIG = GenerationConfig(
+    response_mime_type="application/json", response_schema=TRIVIA_RESPONSE_SCHEMA
+)
+
+# Trivia prompts, filled with str.format_map; the text before the rules
+# context stays constant across runs. Explicit Gemini context caching
+# (CachedContent) is not used: a few retrieved rule chunks are far below its
+# minimum cacheable size.
+TRIVIA_PROMPT_TEMPLATE_RAG = """You are creating trivia questions based on the official FIVB volleyball rules.
+
+RELEVANT RULES CONTEXT:
+{context}
+
+TASK:
+Generate {count} multiple-choice trivia question(s) about {topic} using the rules context above.
+
+Requirements:
+- Base questions on the actual rules provided in the context
+- Each question should be interesting and challenging
+- Questions should test knowledge of specific volleyball rules
+- Provide 4 answer options
+- Indicate which option is correct (0-3)
+- Questions should be appropriate for a volleyball community
+
+Format your response as JSON:
+[
+  {{
+    "question": "Question text here?",
+    "options": ["Option A", "Option B", "Option C", "Option D"],
+    "correct_answer": 0
+  }}
+]
+
+Only return the JSON array, no additional text.
+"""
+
+# Used when RAG is not configured or retrieval returned nothing
+TRIVIA_PROMPT_TEMPLATE = """Generate {count} multiple-choice trivia question(s) about {topic}.
+
+Requirements:
+- Each question should be interesting and challenging
+- Provide 4 answer options
+- Indicate which option is correct (0-3)
+- Questions should be appropriate for a volleyball community
+
+Format your response as JSON:
+[
+  {{
+    "question": "Question text here?",
+    "options": ["Option A", "Option B", "Option C", "Option D"],
+    "correct_answer": 0
+  }}
+]
+
+Only return the JSON array, no additional text.
+"""
+
+
+@lru_cache(maxsize=None)
+def _init_vertex_ai(project_id: str, location: str):
+    """Initialize the Vertex AI SDK once per (project, location) in this process"""
+    vertexai.init(project=project_id, location=location)
+
+
+@lru_cache(maxsize=None)
+def _get_model(model_name: str) -> GenerativeModel:
+    """Shared GenerativeModel per model name, reused across generators and calls"""
+    return GenerativeModel(model_name)
+
+
+def rerank_chunks(query: str, chunks: List[str], keep: int) -> List[str]:
+    """
+    Keep the chunks that score highest for the query under BM25, computed over
+    the retrieved chunks only. Ties (and queries with only stopwords) keep the
+    retrieval (vector similarity) order.
+    """
+    if len(chunks) <= keep:
+        return chunks
+
+    k1, b = 1.5, 0.75
+    chunk_terms = [WORD_RE.findall(chunk.lower()) for chunk in chunks]
+    avg_length = sum(len(terms) for terms in chunk_terms) / len(chunks) or 1
+    query_terms = set(WORD_RE.findall(query.lower())) - RERANK_STOPWORDS
+    doc_freq = {
+        term: sum(1 for terms in chunk_terms if term in terms) for term in query_terms
+    }
+    idf = {
+        term: math.log(1 + (len(chunks) - freq + 0.5) / (freq + 0.5))
+        for term, freq in doc_freq.items()
+    }
+
+    def score(index: int) -> float:
+        terms = chunk_terms[index]
+        length_norm = k1 * (1 - b + b * len(terms) / avg_length)
+        total = 0.0
+        for term in query_terms:
+            tf = terms.count(term)
+            if tf:
+                total += idf[term] * tf * (k1 + 1) / (tf + length_norm)
+        return total
+
+    ranked = sorted(range(len(chunks)), key=score, reverse=True)[:keep]
+    return [chunks[index] for index in sorted(ranked)]
+
+
+@lru_cache(maxsize=128)
+def _retrieve_rules_context(
+    rag_corpus_name: str, query: str, top_k: int, ttl_bucket: int
+) -> str:
+    """
+    Query the RAG corpus, keep the best re-ranked chunks and join them.
+    Cached per (corpus, query, top_k) for the current TTL bucket; errors are not cached.
+    """
+    logger.info(f"Retrieving context for query: {query}")
+
+    # Retrieve relevant chunks from RAG corpus
+    response = rag.retrieval_query(
+        rag_resources=[
+            rag.RagResource(
+                rag_corpus=rag_corpus_name,
+            )
+        ],
+        text=query,
+        similarity_top_k=top_k,
+    )
+
+    # Re-rank the retrieved chunks and combine the ones kept
+    chunks = [context.text for context in response.contexts.contexts]
+    kept = rerank_chunks(query, chunks, RAG_CONTEXT_CHUNKS)
+    contexts = []
+    for i, text in enumerate(kept, 1):
+        contexts.append(f"[Context {i}]\n{text}")
+        logger.debug(f"Retrieved chunk {i}: {text[:100]}...")
+
+    logger.info(f"Retrieved {len(chunks)} context chunks, kept {len(contexts)}")
+    return "\n\n".join(contexts)
+
 
 class TriviaGenerator:
     """Generate trivia questions using Vertex AI with RAG"""
@@ -38,16 +223,39 @@ class TriviaGenerator:
         self.model_name = config.vertex_ai_model
         self.rag_corpus_name = config.rag_corpus_name
 
+        # In-flight or finished rules context retrievals by (topic, top_k)
+        self._context_tasks: Dict[tuple, asyncio.Task] = {}
+
         # Initialize Vertex AI
-        vertexai.init(project=config.project_id, location=config.vertex_ai_location)
+        _init_vertex_ai(config.project_id, config.vertex_ai_location)
 
-    def retrieve_volleyball_rules_context(self, query: str, top_k: int = 5) -> str:
+    def prefetch_rules_context(
+        self, topic: str, top_k: int = RAG_RETRIEVAL_TOP_K
+    ) -> asyncio.Task:
+        """
+        Start retrieving rules context for a topic in a worker thread.
+        Repeated calls for the same topic return the same task.
+        """
+        key = (topic, top_k)
+        if key not in self._context_tasks:
+            self._context_tasks[key] = asyncio.create_task(
+                asyncio.to_thread(
+                    self.retrieve_volleyball_rules_context,
+                    query=f"volleyball rules about {topic}",
+                    top_k=top_k,
+                )
+            )
+        return self._context_tasks[key]
+
+    def retrieve_volleyball_rules_context(
+        self, query: str, top_k: int = RAG_RETRIEVAL_TOP_K
+    ) -> str:
         """
         Retrieve relevant context from volleyball rules using RAG.
 
         Args:
             query: Query to search for relevant rules
-            top_k: Number of top results to retrieve
+            top_k: Number of top results to retrieve before re-ranking
 
         Returns:
             Combined text from retrieved chunks
@@ -57,35 +265,16 @@ class TriviaGenerator:
             return ""
 
         try:
-            logger.info(f"Retrieving context for query: {query}")
-
-            # Retrieve relevant chunks from RAG corpus
-            response = rag.retrieval_query(
-                rag_resources=[
-                    rag.RagResource(
-                        rag_corpus=self.rag_corpus_name,
-                    )
-                ],
-                text=query,
-                similarity_top_k=top_k,
+            ttl_bucket = int(time.time() // RAG_CONTEXT_CACHE_TTL_SECONDS)
+            return _retrieve_rules_context(
+                self.rag_corpus_name, query, top_k, ttl_bucket
             )
 
-            # Combine retrieved contexts
-            contexts = []
-            for i, context in enumerate(response.contexts.contexts, 1):
-                contexts.append(f"[Context {i}]\n{context.text}")
-                logger.debug(f"Retrieved chunk {i}: {context.text[:100]}...")
-
-            combined_context = "\n\n".join(contexts)
-            logger.info(f"Retrieved {len(contexts)} relevant context chunks")
-
-            return combined_context
-
         except Exception as e:
             logger.error(f"Error retrieving RAG context: {e}", exc_info=True)
             return ""
 
-    def generate_trivia_questions(
+    async def generate_trivia_questions(
         self, topic: str = "volleyball", count: int = 1
     ) -> List[Dict]:
         """
@@ -98,84 +287,29 @@ class TriviaGenerator:
         Returns:
             List of question dictionaries
         """
-        model = GenerativeModel(self.model_name)
+        # Retrieve relevant context from volleyball rules in a worker thread,
+        # overlapping the blocking RAG call with model setup
+        retrieve_task = self.prefetch_rules_context(topic)
 
-        # Retrieve relevant context from volleyball rules
-        context_query = f"volleyball rules about {topic}"
-        retrieved_context = self.retrieve_volleyball_rules_context(
-            query=context_query, top_k=5
-        )
+        model = _get_model(self.model_name)
+        retrieved_context = await retrieve_task
 
         # Build prompt with retrieved context
         if retrieved_context:
-            prompt = f"""You are creating trivia questions based on the official FIVB volleyball rules.
-
-RELEVANT RULES CONTEXT:
-{retrieved_context}
-
-TASK:
-Generate {count} multiple-choice trivia question(s) about {topic} using the rules context above.
-
-Requirements:
-- Base questions on the actual rules provided in the context
-- Each question should be interesting and challenging
-- Questions should test knowledge of specific volleyball rules
-- Provide 4 answer options
-- Indicate which option is correct (0-3)
-- Questions should be appropriate for a volleyball community
-
-Format your response as JSON:
-[
-  {{
-    "question": "Question text here?",
-    "options": ["Option A", "Option B", "Option C", "Option D"],
-    "correct_answer": 0
-  }}
-]
-
-Only return the JSON array, no additional text.
-"""
+            prompt = TRIVIA_PROMPT_TEMPLATE_RAG.format_map(
+                {"context": retrieved_context, "count": count, "topic": topic}
+            )
         else:
             # Fallback to generic prompt if RAG is not configured
             logger.warning("No RAG context retrieved, using generic prompt")
-            prompt = f"""Generate {count} multiple-choice trivia question(s) about {topic}.
-
-Requirements:
-- Each question should be interesting and challenging
-- Provide 4 answer options
-- Indicate which option is correct (0-3)
-- Questions should be appropriate for a volleyball community
-
-Format your response as JSON:
-[
-  {{
-    "question": "Question text here?",
-    "options": ["Option A", "Option B", "Option C", "Option D"],
-    "correct_answer": 0
-  }}
-]
-
-Only return the JSON array, no additional text.
-"""
+            prompt = TRIVIA_PROMPT_TEMPLATE.format_map({"count": count, "topic": topic})
 
         try:
-            response = model.generate_content(prompt)
-            text = response.text.strip()
-
-            # Remove markdown code blocks if present
-            if text.startswith("```json"):
-                text = text[7:]
-            if text.startswith("```"):
-                text = text[3:]
-            if text.endswith("```"):
-                text = text[:-3]
-
-            text = text.strip()
-
-            # Parse JSON response
-            import json
-
-            questions = json.loads(text)
+            # Gemini returns bare JSON matching TRIVIA_RESPONSE_SCHEMA
+            response = await model.generate_content_async(
+                prompt, generation_config=TRIVIA_GENERATION_CONFIG
+            )
+            questions = orjson.loads(response.text)
 
             logger.info(f"Generated {len(questions)} trivia questions")
             return questions
@@ -192,6 +326,20 @@ Only return the JSON array, no additional text.
             ]
 
 
+async def claim_pooled_question(
+    db_session: AsyncSession, topic: str
+) -> Optional[TriviaQuestion]:
+    """Lock the oldest unused pre-generated question; concurrent runs skip it"""
+    result = await db_session.execute(
+        select(TriviaQuestion)
+        .where(TriviaQuestion.topic == topic, TriviaQuestion.used_at.is_(None))
+        .order_by(TriviaQuestion.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    return result.scalars().first()
+
+
 async def run_trivia_job(job_name: str = "trivia_tuesday"):
     """Main trivia job execution"""
     config = JobConfig()
@@ -206,56 +354,84 @@ async def run_trivia_job(job_name: str = "trivia_tuesday"):
         sys.exit(1)
 
     db_session = None
-    bot = None
+    # One timestamp for the whole run so day_of_week and created_at agree
+    now = datetime.utcnow()
 
     try:
         # Initialize database session
-        db_session = get_db_session(config)
+        db_session = AsyncSessionLocal()
 
         # Initialize Telegram bot
-        bot = Bot(token=config.telegram_bot_token)
-
-        # Generate trivia questions
-        logger.info("Generating trivia questions...")
-        generator = TriviaGenerator(config)
-        questions = generator.generate_trivia_questions(topic="volleyball", count=1)
+        bot = get_bot(config.telegram_bot_token)
 
-        if not questions:
-            raise Exception("No questions generated")
+        # Use a pre-generated question if one is left from an earlier batch
+        pooled_question = await claim_pooled_question(db_session, TRIVIA_TOPIC)
 
-        # Use the first question
-        question_data = questions[0]
+        if pooled_question:
+            logger.info(f"Using pre-generated trivia question {pooled_question.id}")
+            question_data = pooled_question.question
+            pooled_question.used_at = now
+        else:
+            # Generate a batch of trivia questions; Vertex AI is only set up
+            # when the pool is empty
+            logger.info(f"Generating {TRIVIA_BATCH_SIZE} trivia questions...")
+            generator = TriviaGenerator(config)
+            questions = await generator.generate_trivia_questions(
+                topic=TRIVIA_TOPIC, count=TRIVIA_BATCH_SIZE
+            )
 
-        # Send poll to Telegram
+            if not questions:
+                raise Exception("No questions generated")
+
+            # Use the first question and keep the rest, even if posting fails
+            question_data, *spare_questions = questions
+            if spare_questions:
+                db_session.add_all(
+                    TriviaQuestion(topic=TRIVIA_TOPIC, question=question)
+                    for question in spare_questions
+                )
+                await db_session.commit()
+
+        # Send poll to Telegram, looking up the job definition meanwhile so
+        # the final commit does not wait on that query. Both settle before any
+        # error is raised, so the session is idle when the except block uses it.
         logger.info(f"Sending poll to Telegram chat: {config.telegram_chat_id}")
-        poll_id = await send_telegram_poll(
-            bot=bot,
-            chat_id=config.telegram_chat_id,
-            question=question_data["question"],
-            options=question_data["options"],
-            is_anonymous=False,
+        poll_id, job_id_lookup = await asyncio.gather(
+            send_telegram_poll(
+                bot=bot,
+                chat_id=config.telegram_chat_id,
+                question=question_data["question"],
+                options=question_data["options"],
+                is_anonymous=False,
+            ),
+            aget_job_definition_id(db_session, job_name),
+            return_exceptions=True,
         )
+        for outcome in (poll_id, job_id_lookup):
+            if isinstance(outcome, BaseException):
+                raise outcome
 
         # Record poll in database
         logger.info(f"Recording poll in database: {poll_id}")
         poll = Poll(
             poll_id=poll_id,
             poll_type="trivia",
-            day_of_week=datetime.utcnow().strftime("%A"),
+            day_of_week=now.strftime("%A"),
             title=question_data["question"],
-            questions={"questions": questions},
-            created_at=datetime.utcnow(),
+            questions={"questions": [question_data]},
+            created_at=now,
         )
         db_session.add(poll)
-        db_session.commit()
 
-        # Record successful job run
-        record_job_run(
+        # Record successful job run in the same transaction as the poll
+        await arecord_job_run(
             db_session,
             job_name=job_name,
             status="success",
             payload={"poll_id": poll_id, "question": question_data["question"]},
+            commit=False,
         )
+        await db_session.commit()
 
         logger.info(f"Trivia job completed successfully. Poll ID: {poll_id}")
 
@@ -263,7 +439,9 @@ async def run_trivia_job(job_name: str = "trivia_tuesday"):
         logger.error(f"Trivia job failed: {e}", exc_info=True)
 
         if db_session:
-            record_job_run(
+            # Release a claimed question so the next run can post it
+            await db_session.rollback()
+            await arecord_job_run(
                 db_session, job_name=job_name, status="failed", error_message=str(e)
             )
 
@@ -271,10 +449,7 @@ async def run_trivia_job(job_name: str = "trivia_tuesday"):
 
     finally:
         if db_session:
-            db_session.close()
-
-        if bot:
-            await bot.session.close()
+            await db_session.close()
 
 
 def main():
@@ -285,7 +460,7 @@ def main():
     )
 
     logger.info(f"Starting trivia job: {job_name}")
-    asyncio.run(run_trivia_job(job_name))
+    run_job(run_trivia_job(job_name))
 
 
 if __name__ == "__main__":